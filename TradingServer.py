@@ -1,50 +1,56 @@
 import os
 from fastapi import FastAPI, Request
 from dotenv import load_dotenv
-from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler
-from datetime import datetime, time, timedelta
+from datetime import datetime, time
 from zoneinfo import ZoneInfo
-from supabase import create_client
 from fastapi.responses import JSONResponse
-from reporting import send_report
-import random
-import httpx
-import re
+from reporting import send_report, load_snapshots, record_trade, range_report
+from db import supabase, supabase_call, safe_supabase_call, gather_calls
+from alias import get_or_create_alias, warm_alias_cache
+from user_stats import get_user_stats, merge_records, stats_from_record, record_scalping, record_swing_open, record_swing_close
+import user_stats
+import db
+import feedback_cache
+from open_positions import get_open_positions, add_position, remove_position
+import sector_store
+import daily_buckets
+from sector_digest import SectorDigest
+import charts
+from worker_pool import WorkerPool
+from update_scheduler import PerChatUpdateProcessor
+from persistence import SQLitePersistence
+from messaging import cleanup_later, drain_cleanup, SendScheduler, BROADCAST
+from market_data import get_top3_tokens, peek_top3_tokens, schedule_prefetch
+import http_client
+from llm import stream_chat
+import asyncio
+import json
 
 TOKEN = os.getenv("BOT_TOKEN")
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_KEY")
-COINGECKO_API = "https://api.coingecko.com/api/v3"
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-
-supabase = create_client(url, key)
-telegram_app = Application.builder().token(TOKEN).build()
+WEBHOOK_QUEUE = os.getenv("WEBHOOK_QUEUE", "0") == "1"          # 1 이면 즉시 200 응답 후 큐에서 처리
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))   # 처리 대기 업데이트 상한 (초과 시 503)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "8"))   # 전역 동시 처리 상한
+
+update_processor = PerChatUpdateProcessor(UPDATE_CONCURRENCY, max_queued=WEBHOOK_QUEUE_SIZE)
+persistence = SQLitePersistence()
+send_scheduler = SendScheduler()
+telegram_app = (
+    Application.builder()
+    .token(TOKEN)
+    .concurrent_updates(update_processor)
+    .persistence(persistence)
+    .rate_limiter(send_scheduler)
+    .build()
+)
 app = FastAPI()
 
 @app.api_route("/", methods=["GET", "HEAD"])
 async def root():
     return {"status": "ok"}
     
-# ====== 별칭 생성기 ======
-ADJECTIVES = ["불타는", "날쌘", "예리한", "강인한", "차가운", "뜨거운", "빠른", "은밀한", "화끈한", "거대한", "섹시한", "냉정한", "영리한", "잔혹한", "고독한", "거친", "맹렬한", "전설의 ", "저주받은", "깜찍한", "엉뚱한", "상큼한", "도도한", "노련한"]
-ANIMALS = ["곰", "호랑이", "코브라", "매", "황소", "늑대", "독수리", "상어", "팬더", "사자", "부엉이", "고양이", "아깽이", "강아지", "개미", "불개미", "벌꿀오소리", "얼룩말", "캥거루", "침팬치", "여우", "고래", "돌고래", "해파리", "펭귄", "물개", "까마귀", "앵무새", "공작새", "참새", "악어", "도마뱀", "개구리", "장수말벌", "풍뎅이"]
-
-def generate_alias(user_id: int) -> str:
-    last4 = str(user_id)[-4:]
-    adj = random.choice(ADJECTIVES)
-    animal = random.choice(ANIMALS)
-    return f"{adj}{animal}-{last4}"
-    
-def get_or_create_alias(user_id: int):
-    response = supabase.table("user_alias").select("alias").eq("user_id", user_id).execute()
-    if response.data:
-        return response.data[0]["alias"]
-
-    alias = generate_alias(user_id)
-    supabase.table("user_alias").insert({"user_id": user_id, "alias": alias}).execute()
-    return alias
-
 #전역 변수
 MAIN_MENU = [["Checklist", "📓 일지작성(단타)", "일지작성(장기)"], ["📊 통계보기", "❌ 취소", "🧠 AI 피드백"]]
 LONG_MENU = [["새 진입 기록", "청산하기"], ["❌ 취소 / 뒤로가기"]]
@@ -54,13 +60,6 @@ IMAGE, SYMBOL, SIDE, LEVERAGE, PNL, REASON = range(6)
 L_IMAGE, L_SYMBOL, L_SIDE, L_LEVERAGE, L_ENTRY_PRICE, L_REASON_ENTRY = range(6, 12)  # 장기 진입
 L_MENU, L_SELECT_TRADE, L_EXIT_PRICE, L_PNL, L_REASON_EXIT = range(12, 17)  # 장기 청산
 
-def safe_supabase_call(query):
-    try:
-        return query.execute()
-    except Exception as e:
-        print("❌ Supabase error:", e)
-        return None
-
 # /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat.type != "private":
@@ -68,7 +67,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     print("Chat ID:", update.effective_chat.id)
     user_id = update.effective_user.id
-    alias = get_or_create_alias(user_id)
+    alias = await get_or_create_alias(user_id)
     reply_markup = ReplyKeyboardMarkup(MAIN_MENU, resize_keyboard=True)
     await update.message.reply_text(f"환영합니다! 매매일지 봇입니다!\n"f"👉 당신의 고유 별칭 <b>{alias}</b> 입니다.\n"f"리포트에서 동일한 별칭으로 표시됩니다.", reply_markup=reply_markup, parse_mode="HTML")
 
@@ -76,10 +75,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def scalping_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"👤 {update.effective_user.id} -> 단타 일지작성 시작")
     chat_id = update.effective_chat.id
-    try:
-        await context.bot.delete_message(chat_id, update.message.message_id)
-    except:
-        pass
+    cleanup_later(context, chat_id, [update.message.message_id])
     
     # 안내 메시지도 리스트에 쌓기 위한 초기화
     context.user_data["bot_msgs"] = []
@@ -107,7 +103,7 @@ async def get_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["symbol"] = update.message.text
 
     # 유저 입력 메시지 삭제
-    await context.bot.delete_message(update.effective_chat.id, update.message.message_id)
+    cleanup_later(context, update.effective_chat.id, [update.message.message_id])
 
     msg = await update.message.reply_text("포지션을 입력하세요 (롱/숏)")
     context.user_data["bot_msgs"].append(msg.message_id)
@@ -116,7 +112,7 @@ async def get_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def get_side(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["side"] = update.message.text
-    await context.bot.delete_message(update.effective_chat.id, update.message.message_id)
+    cleanup_later(context, update.effective_chat.id, [update.message.message_id])
 
     msg = await update.message.reply_text("배율을 입력하세요 (예: 1, 3, 5)")
     context.user_data["bot_msgs"].append(msg.message_id)
@@ -135,7 +131,7 @@ async def get_leverage(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return LEVERAGE
 
     context.user_data["leverage"] = leverage
-    await context.bot.delete_message(update.effective_chat.id, update.message.message_id)
+    cleanup_later(context, update.effective_chat.id, [update.message.message_id])
 
     msg = await update.message.reply_text("최종 결과 수익률/손실률(%)을 입력하세요 (예: 12, -5)")
     context.user_data["bot_msgs"].append(msg.message_id)
@@ -152,7 +148,7 @@ async def get_pnl(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return PNL
 
     context.user_data["pnl_pct"] = pnl_pct
-    await context.bot.delete_message(update.effective_chat.id, update.message.message_id)
+    cleanup_later(context, update.effective_chat.id, [update.message.message_id])
 
     msg = await update.message.reply_text("진입 근거를 입력하세요")
     context.user_data["bot_msgs"].append(msg.message_id)
@@ -161,7 +157,6 @@ async def get_pnl(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def get_reason(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["reason"] = update.message.text
-    await context.bot.delete_message(update.effective_chat.id, update.message.message_id)
 
     user_id = update.message.from_user.id
     image_id = context.user_data["image_id"]
@@ -173,7 +168,7 @@ async def get_reason(update: Update, context: ContextTypes.DEFAULT_TYPE):
     date_now = datetime.now().strftime("%Y-%m-%d %H:%M")
 
     # DB 저장 supabase
-    supabase.table("scalping_trades").insert({
+    inserted = await supabase_call(supabase.table("scalping_trades").insert({
     "user_id": user_id,
     "image_id": image_id,
     "symbol": symbol,
@@ -181,21 +176,10 @@ async def get_reason(update: Update, context: ContextTypes.DEFAULT_TYPE):
     "leverage": leverage,
     "pnl_pct": pnl_pct,
     "reason": reason
-}).execute()
-
-    # 지금까지 봇이 보낸 안내 메시지들 싹 삭제
-    for msg_id in context.user_data.get("bot_msgs", []):
-        try:
-            await context.bot.delete_message(update.effective_chat.id, msg_id)
-        except:
-            pass
-    context.user_data["bot_msgs"] = []  # 초기화
-    
-    if "user_image_id" in context.user_data:
-        try:
-            await context.bot.delete_message(update.effective_chat.id, context.user_data["user_image_id"])
-        except:
-            pass
+}))
+    feedback_cache.invalidate(user_id)
+    if inserted.data:
+        record_trade("scalping", inserted.data[0])
 
     # 최종 메시지 (이미지 + 요약)만 남김
     await update.message.reply_photo(
@@ -210,92 +194,44 @@ async def get_reason(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"- 진입 근거: \"{reason}\""
         )
     )
-    return ConversationHandler.END
 
-# =========================
-# 통계보기 유틸 함수
-# =========================
-def calc_stats(profits):
-    if not profits:
-        return {
-            "count": 0, "win": 0, "lose": 0, "win_rate": 0,
-            "total": 0, "avg": 0, "pf": 0, "pf_eval": "N/A"
-        }
-    
-    total_trades = len(profits)
-    win_trades = len([p for p in profits if p > 0])
-    lose_trades = len([p for p in profits if p < 0])
-    gross_profit = sum([p for p in profits if p > 0])
-    gross_loss = abs(sum([p for p in profits if p < 0]))
-    total_profit = sum(profits)
-    avg_profit = total_profit / total_trades
-    win_rate = win_trades / total_trades * 100
-    profit_factor = (gross_profit / gross_loss) if gross_loss > 0 else float("inf")
-
-    if profit_factor == float("inf"):
-        pf_eval = "∞ 무손실"
-    elif profit_factor >= 2:
-        pf_eval = "✅ 양호"
-    elif profit_factor >= 1:
-        pf_eval = "⚠️ 보통"
-    else:
-        pf_eval = "❌ 위험"
+    # 지금까지 봇이 보낸 안내 메시지들 + 유저 입력 싹 삭제 (응답 후 백그라운드 일괄 삭제)
+    cleanup_later(context, update.effective_chat.id, [
+        update.message.message_id,
+        *context.user_data.get("bot_msgs", []),
+        context.user_data.pop("user_image_id", None),
+    ])
+    context.user_data["bot_msgs"] = []  # 초기화
 
-    return {
-        "count": total_trades, "win": win_trades, "lose": lose_trades,
-        "win_rate": win_rate, "total": total_profit, "avg": avg_profit,
-        "pf": profit_factor, "pf_eval": pf_eval
-    }
+    # 응답 후 개인 통계 갱신 (실패 시 user_stats 가 원본 테이블로 재계산)
+    await record_scalping(user_id, pnl_pct)
+    return ConversationHandler.END
 
-# =========================
-# 통계보기 유틸 함수
-# =========================
-def safe_float(value):
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return None
-    
 # =========================
 # 통계보기
 # =========================
 async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"👤 {update.effective_user.id} -> 통계보기 요청")
     chat_id = update.effective_chat.id
-    try:
-        await context.bot.delete_message(chat_id, update.message.message_id)
-    except:
-        pass
+    cleanup_later(context, chat_id, [update.message.message_id])
     
     user_id = update.message.from_user.id
 
-    # 단타
-    response = safe_supabase_call(
-        supabase.table("scalping_trades").select("pnl_pct").eq("user_id", user_id)
-    )
-    scalping_profits = [safe_float(row["pnl_pct"]) for row in response.data if row["pnl_pct"] is not None] if response else []
-    scalping_profits = [p for p in scalping_profits if p is not None]
-
-    response = safe_supabase_call(
-        supabase.table("swing_trades").select("pnl_pct, exit_price").eq("user_id", user_id)
-    )
-    swing_profits = [safe_float(row["pnl_pct"]) for row in response.data if row["pnl_pct"] is not None] if response else []
-    swing_profits = [p for p in swing_profits if p is not None]
-
-    closed_trades = sum(1 for row in (response.data if response else []) if row["exit_price"] is not None)
-    open_trades   = sum(1 for row in (response.data if response else []) if row["exit_price"] is None)
+    # 증분 집계 레코드 조회 (전체 이력 스캔 없음)
+    records = await get_user_stats(user_id)
+    scalp_rec = records["scalping"]
+    swing_rec = records["swing"]
+    closed_trades = swing_rec["closed_count"]
+    open_trades = swing_rec["open_count"]
 
-    # 전체
-    all_profits = scalping_profits + swing_profits
-
-    if not all_profits:
+    if not (scalp_rec["count"] + swing_rec["count"]):
         await update.message.reply_text("📊 기록이 없습니다.")
         return
 
     # 통계 계산
-    stats_scalp = calc_stats(scalping_profits)
-    stats_swing = calc_stats(swing_profits)
-    stats_total = calc_stats(all_profits)
+    stats_scalp = stats_from_record(scalp_rec)
+    stats_swing = stats_from_record(swing_rec)
+    stats_total = stats_from_record(merge_records(scalp_rec, swing_rec))
 
     # 출력 메시지
     stats_message = (
@@ -330,33 +266,66 @@ async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(stats_message, parse_mode="HTML")
     return ConversationHandler.END
     
+FEEDBACK_EDIT_INTERVAL = float(os.getenv("FEEDBACK_EDIT_INTERVAL", "1.5"))   # 초, 스트리밍 중 메시지 수정 간격
+FEEDBACK_PREVIEW_LIMIT = 3500   # 수정 메시지 길이 상한 (Telegram 4096자)
+FEEDBACK_WORKERS = int(os.getenv("FEEDBACK_WORKERS", "2"))           # 동시에 실행할 피드백 작업 수
+FEEDBACK_QUEUE_SIZE = int(os.getenv("FEEDBACK_QUEUE_SIZE", "100"))
+
 async def ai_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # 요청만 큐에 넣고 생성은 백그라운드 워커가 처리
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
 
-    try:
-        await context.bot.delete_message(chat_id, update.message.message_id)
-    except:
-        pass
+    cleanup_later(context, chat_id, [update.message.message_id])
+
+    # 마지막 분석 이후 새 기록이 없으면 DB 조회 / 큐 대기 없이 바로 응답
+    cached = feedback_cache.get(user_id)
+    if cached:
+        print(f"[Feedback] cache hit user={user_id}")
+        await send_feedback(context, chat_id, cached["records"], cached["reply"], cached["good"], cached["bad"])
+        return
+
+    if feedback_pool.is_active(user_id):
+        await context.bot.send_message(chat_id, "⏳ 이미 AI 피드백을 생성 중입니다. 잠시만 기다려 주세요.")
+        return
+
+    position = feedback_pool.queue.qsize() + 1
     processing_msg = await context.bot.send_message(
-        chat_id, "🧠 AI 피드백을 생성 중입니다...\n⏳ 잠시만 기다려 주세요."
+        chat_id, f"🧠 AI 피드백 요청이 접수되었습니다.\n⏳ 대기 순번: {position}번째"
     )
-    
-    response_scalp = safe_supabase_call(
+    try:
+        position = feedback_pool.submit((context, user_id, chat_id, processing_msg.message_id), key=user_id)
+    except asyncio.QueueFull:
+        await safe_edit(context.bot, chat_id, processing_msg.message_id, "⚠️ 요청이 많습니다. 잠시 후 다시 시도해주세요.")
+        return
+    if position is None:
+        cleanup_later(context, chat_id, [processing_msg.message_id])
+        await context.bot.send_message(chat_id, "⏳ 이미 AI 피드백을 생성 중입니다. 잠시만 기다려 주세요.")
+
+async def run_feedback_job(job):
+    context, user_id, chat_id, message_id = job
+    try:
+        await generate_feedback(context, user_id, chat_id, message_id)
+    except Exception:
+        await safe_edit(context.bot, chat_id, message_id, "⚠️ AI 피드백 생성에 실패했습니다.")
+        raise
+
+async def generate_feedback(context, user_id, chat_id, message_id):
+    await safe_edit(context.bot, chat_id, message_id, "🧠 AI 피드백을 생성 중입니다...\n⏳ 잠시만 기다려 주세요.")
+
+    generation = feedback_cache.generation(user_id)
+    response_scalp, response_swing = await gather_calls(
         supabase.table("scalping_trades")
         .select("reason, pnl_pct, symbol, side, image_id")
         .eq("user_id", user_id)
         .order("created_at", desc=True)
-        .limit(30)
-        )
-
-    response_swing = safe_supabase_call(
+        .limit(30),
         supabase.table("swing_trades")
         .select("reason_entry, reason_exit, pnl_pct, symbol, side, image_id")
         .eq("user_id", user_id)
-        .order("trade_id", desc=True)   
-        .limit(30)
-        )
+        .order("trade_id", desc=True)
+        .limit(30),
+    )
     
     records = []
     if response_scalp and response_scalp.data:
@@ -389,7 +358,7 @@ async def ai_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 })
 
     if not records:
-        await context.bot.delete_message(chat_id, processing_msg.message_id)
+        await context.bot.delete_message(chat_id, message_id)
         await context.bot.send_message(chat_id, "피드백할 매매 기록이 없습니다.")
         return
         
@@ -416,42 +385,69 @@ async def ai_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         prompt_text += f"- 진입 근거: {r['reason']}\n"
         prompt_text += f"- 손익률: {r['pnl_pct']}%\n\n"
 
-    GPTS_API_URL = os.getenv("GPTS_API_URL") 
-    GPTS_API_KEY = os.getenv("GPTS_API_KEY")
+    # 대기 중 다른 요청이 같은 기록 묶음으로 이미 생성했으면 GPT 호출 없이 재사용
+    fp = feedback_cache.fingerprint(records)
+    cached = feedback_cache.get(user_id, fp)
+    if cached:
+        print(f"[Feedback] cache hit (fingerprint) user={user_id}")
+        await send_feedback(context, chat_id, records, cached["reply"], cached["good"], cached["bad"], message_id=message_id)
+        return
 
+    messages = [
+        {"role": "system", "content": "당신은 투자의 전문가이자 신입니다. 노예들을 매우쳐서 투자를 도와주세요"},
+        {"role": "user", "content": prompt_text}
+    ]
+
+    # 스트리밍으로 받으면서 안내 메시지를 주기적으로 수정
+    gpt_reply = ""
+    shown = ""
+    last_edit = 0.0   # 첫 조각은 바로 표시
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.post(
-                GPTS_API_URL,
-                headers={"Authorization": f"Bearer {GPTS_API_KEY}"},
-                json={
-                    "model": "gpt-4o",
-                    "messages": [
-                        {"role": "system", "content": "당신은 투자의 전문가이자 신입니다. 노예들을 매우쳐서 투자를 도와주세요"},
-                        {"role": "user", "content": prompt_text}
-                    ]
-                }
-            )
-        r.raise_for_status()
-        gpt_reply = r.json().get("choices", [{}])[0].get("message", {}).get("content", "⚠️ 응답 없음")
-        
+        async for piece in stream_chat(messages):
+            gpt_reply += piece
+            now = asyncio.get_running_loop().time()
+            if now - last_edit >= FEEDBACK_EDIT_INTERVAL:
+                last_edit = now
+                preview = gpt_reply[-FEEDBACK_PREVIEW_LIMIT:]
+                if preview != shown:
+                    shown = preview
+                    await safe_edit(context.bot, chat_id, message_id, f"🧠 AI 피드백 (생성 중...)\n\n{preview}")
     except Exception as e:
         print("❌ GPT 호출 실패:", e)
-        await context.bot.delete_message(chat_id, processing_msg.message_id)
+        await context.bot.delete_message(chat_id, message_id)
         await context.bot.send_message(chat_id, "⚠️ AI 피드백 생성에 실패했습니다.")
         return
 
-    await context.bot.delete_message(chat_id, processing_msg.message_id)
-    await context.bot.send_message(chat_id, f"🧠 AI 피드백\n\n{gpt_reply}", parse_mode="HTML")
+    if not gpt_reply:
+        gpt_reply = "⚠️ 응답 없음"
+
+    # 번호 파싱은 완성된 전체 텍스트로
+    good_num, bad_num = feedback_cache.parse_best_worst(gpt_reply)
+    feedback_cache.put(user_id, fp, gpt_reply, good_num, bad_num, records, generation=generation)
+
+    await send_feedback(context, chat_id, records, gpt_reply, good_num, bad_num, message_id=message_id)
+
+async def safe_edit(bot, chat_id, message_id, text, **kwargs):
+    try:
+        await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, **kwargs)
+        return True
+    except Exception as e:
+        print(f"[Feedback] 메시지 수정 실패: {e}")
+        return False
+
+async def send_feedback(context, chat_id, records, gpt_reply, good_num, bad_num, message_id=None):
+    text = f"🧠 AI 피드백\n\n{gpt_reply}"
+    # 스트리밍 중이던 메시지를 최종본으로 교체, 실패하면(길이 초과 / HTML 오류) 새로 전송
+    if message_id is None or not await safe_edit(context.bot, chat_id, message_id, text, parse_mode="HTML"):
+        if message_id is not None:
+            cleanup_later(context, chat_id, [message_id])
+        await context.bot.send_message(chat_id, text, parse_mode="HTML")
 
-    good_match = re.search(r"가장\s*좋은\s*매매\s*번호\s*:\s*(\d+)", gpt_reply)
-    bad_match  = re.search(r"가장\s*나쁜\s*매매\s*번호\s*:\s*(\d+)", gpt_reply)
     print("📊 전체 records:", records)
-    print("🎯 GPT good_match:", good_match.group(1) if good_match else None)
-    print("🎯 GPT bad_match:", bad_match.group(1) if bad_match else None)
+    print("🎯 GPT good_match:", good_num)
+    print("🎯 GPT bad_match:", bad_num)
     
-    if good_match:
-        good_num = int(good_match.group(1))
+    if good_num:
         if 0 < good_num <= len(records):
             record = records[good_num-1]
             if record.get("image_id"):
@@ -461,8 +457,7 @@ async def ai_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     caption=f"✅ GPT가 꼽은 가장 좋은 매매 {good_num}\n{record['symbol']} {record['side']} | PnL {record['pnl_pct']}%"
                 )
 
-    if bad_match:
-        bad_num = int(bad_match.group(1))
+    if bad_num:
         if 0 < bad_num <= len(records):
             record = records[bad_num-1]
             if record.get("image_id"):
@@ -473,6 +468,27 @@ async def ai_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
 
 
+REPORT_RANGE_MAX_DAYS = 366
+
+# /report 2025-01-01 2025-01-31
+async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    usage = "사용법: /report 시작일 종료일\n예: /report 2025-01-01 2025-01-31"
+    try:
+        start_day, end_day = (datetime.strptime(arg, "%Y-%m-%d").date() for arg in context.args)
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
+    if start_day > end_day:
+        start_day, end_day = end_day, start_day
+    if (end_day - start_day).days >= REPORT_RANGE_MAX_DAYS:
+        await update.message.reply_text(f"❌ 기간은 최대 {REPORT_RANGE_MAX_DAYS}일까지 조회할 수 있습니다.")
+        return
+
+    msg, chart = await range_report(start_day, end_day)
+    await update.message.reply_text(msg, parse_mode="HTML")
+    if chart:
+        await update.message.reply_photo(InputFile(chart, filename="report.png"))
+
 async def show_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         await context.bot.delete_message(
@@ -482,7 +498,7 @@ async def show_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except:
         pass
     user_id = int(update.effective_user.id)
-    response = safe_supabase_call(
+    response = await safe_supabase_call(
         supabase.table("checklists").select("slot, text").eq("user_id", user_id).order("slot")
     )
     rows = response.data if response else []
@@ -523,7 +539,7 @@ async def save_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not slot:
         return
     text = update.message.text
-    safe_supabase_call(
+    await safe_supabase_call(
         supabase.table("checklists").upsert({
             "user_id": user_id,
             "slot": slot,
@@ -552,10 +568,7 @@ async def save_checklist(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def swing_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print("🔥 swing_start 진입됨:", update.message.text)
     chat_id = update.effective_chat.id
-    try:
-        await context.bot.delete_message(chat_id, update.message.message_id)
-    except:
-        pass
+    cleanup_later(context, chat_id, [update.message.message_id])
     
     reply_markup = ReplyKeyboardMarkup(LONG_MENU, resize_keyboard=True)
     context.user_data["bot_msgs"] = []
@@ -568,10 +581,7 @@ async def swing_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def get_l_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"👤 {update.effective_user.id} -> 장기 새 진입 시작 (이미지 대기)")
     chat_id = update.effective_chat.id
-    try:
-        await context.bot.delete_message(chat_id, update.message.message_id)
-    except:
-        pass
+    cleanup_later(context, chat_id, [update.message.message_id])
     
     if not update.message.photo:
         print("⚠️ get_l_image: No photo found, asking again")
@@ -595,7 +605,7 @@ async def get_l_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["symbol"] = update.message.text   
     
     # 유저메세지 삭제
-    await context.bot.delete_message(update.effective_chat.id, update.message.message_id)
+    cleanup_later(context, update.effective_chat.id, [update.message.message_id])
     
     msg = await update.message.reply_text("포지션을 입력하세요 (롱/숏)")
     context.user_data.setdefault("bot_msgs", []).append(msg.message_id)       
@@ -605,7 +615,7 @@ async def get_l_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def get_l_side(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print("🚀 get_l_side triggered:", update.message.text)
     context.user_data["side"] = update.message.text     
-    await context.bot.delete_message(update.effective_chat.id, update.message.message_id)
+    cleanup_later(context, update.effective_chat.id, [update.message.message_id])
     
     msg = await update.message.reply_text("배율을 입력하세요 (예: 1, 3, 5)")
     context.user_data.setdefault("bot_msgs", []).append(msg.message_id)       
@@ -624,7 +634,7 @@ async def get_l_leverage(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data.setdefault("bot_msgs", []).append(msg.message_id)
         return L_LEVERAGE
     context.user_data["leverage"] = leverage
-    await context.bot.delete_message(update.effective_chat.id, update.message.message_id)
+    cleanup_later(context, update.effective_chat.id, [update.message.message_id])
     
     msg = await update.message.reply_text("진입가를 입력하세요 (예: 24500)")
     context.user_data.setdefault("bot_msgs", []).append(msg.message_id)       
@@ -644,7 +654,7 @@ async def get_l_entry_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return L_ENTRY_PRICE
 
     context.user_data["entry_price"] = entry_price
-    await context.bot.delete_message(update.effective_chat.id, update.message.message_id)
+    cleanup_later(context, update.effective_chat.id, [update.message.message_id])
 
     msg = await update.message.reply_text("진입 근거를 입력하세요")
     context.user_data["bot_msgs"].append(msg.message_id)
@@ -654,7 +664,6 @@ async def get_l_entry_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def get_l_reason_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print("🚀 get_l_reason_entry triggered:", update.message.text)
     context.user_data["reason_entry"] = update.message.text   
-    await context.bot.delete_message(update.effective_chat.id, update.message.message_id)
 
     user_id = update.message.from_user.id
     image_id = context.user_data["image_id"]
@@ -666,7 +675,7 @@ async def get_l_reason_entry(update: Update, context: ContextTypes.DEFAULT_TYPE)
     date_now = datetime.now().strftime("%Y-%m-%d %H:%M")
 
     #DB
-    safe_supabase_call(
+    inserted = await safe_supabase_call(
         supabase.table("swing_trades").insert({
             "user_id": user_id,
             "image_id": image_id,
@@ -677,21 +686,12 @@ async def get_l_reason_entry(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "reason_entry": reason_entry
     })
 )
+    if inserted:
+        feedback_cache.invalidate(user_id)
+        if inserted.data:
+            add_position(user_id, inserted.data[0])
 
 
-    for msg_id in context.user_data.get("bot_msgs", []):
-        try:
-            await context.bot.delete_message(update.effective_chat.id, msg_id)
-        except:
-            pass
-    context.user_data["bot_msgs"] = []
-    
-    if "user_image_id" in context.user_data:
-        try:
-            await context.bot.delete_message(update.effective_chat.id, context.user_data["user_image_id"])
-        except:
-            pass
-
     await update.message.reply_photo(
         photo=image_id,
         caption=(f"🕰 [장기 매매일지 - 진입]\n"
@@ -702,8 +702,16 @@ async def get_l_reason_entry(update: Update, context: ContextTypes.DEFAULT_TYPE)
                  f"- 진입가: {entry_price}\n"
                  f"- 진입 근거: \"{reason_entry}\"")
     )   
+    cleanup_later(context, update.effective_chat.id, [
+        update.message.message_id,
+        *context.user_data.get("bot_msgs", []),
+        context.user_data.pop("user_image_id", None),
+    ])
+    context.user_data["bot_msgs"] = []
     reply_markup = ReplyKeyboardMarkup(LONG_MENU, resize_keyboard=True)
     await update.message.reply_text("기록완료", reply_markup=reply_markup)
+    if inserted:
+        await record_swing_open(user_id)
     return L_MENU
 
 
@@ -713,13 +721,10 @@ async def get_l_reason_entry(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def swing_show_open_positions(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"👤 {update.effective_user.id} -> 장기 청산하기 버튼 클릭")
     chat_id = update.effective_chat.id
-    try:
-        await context.bot.delete_message(chat_id, update.message.message_id)
-    except:
-        pass
+    cleanup_later(context, chat_id, [update.message.message_id])
     
-    response = supabase.table("swing_trades").select("trade_id, symbol, side, entry_price").is_("exit_price", None).execute()
-    rows = response.data
+    # 본인 열린 포지션만 (사용자별 인덱스, 최초 1회만 DB 조회)
+    rows = await get_open_positions(update.effective_user.id)
 
     if not rows:
         msg = await update.message.reply_text("📭 현재 열린 포지션이 없습니다.")
@@ -783,7 +788,9 @@ async def swing_reason_exit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.setdefault("user_msgs", []).append(update.message.message_id)
 
     # DB에서 entry_price, side, leverage 가져오기
-    response = supabase.table("swing_trades").select("entry_price, side, leverage").eq("trade_id", trade_id).execute()
+    response = await supabase_call(
+        supabase.table("swing_trades").select("user_id, entry_price, side, leverage").eq("trade_id", trade_id)
+    )
     
     if not response.data:   
         await update.message.reply_text("❌ 해당 포지션 정보를 찾을 수 없습니다.")
@@ -803,27 +810,16 @@ async def swing_reason_exit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pnl_pct = round(pnl_pct, 2)
 
     # DB 업데이트
-    supabase.table("swing_trades").update({
+    closed = await supabase_call(supabase.table("swing_trades").update({
     "exit_price": exit_price,
     "pnl_pct": pnl_pct,
     "reason_exit": reason_exit,
     "date_closed": datetime.now().isoformat()
-}).eq("trade_id", trade_id).execute()
-
-    # 불필요 메시지 삭제
-    chat_id = update.effective_chat.id
-    for msg_id in context.user_data.get("bot_msgs", []):
-        try:
-            await context.bot.delete_message(chat_id, msg_id)
-        except:
-            pass
-    for msg_id in context.user_data.get("user_msgs", []):
-        try:
-            await context.bot.delete_message(chat_id, msg_id)
-        except:
-            pass
-    context.user_data["bot_msgs"] = []
-    context.user_data["user_msgs"] = []
+}).eq("trade_id", trade_id))
+    feedback_cache.invalidate(row["user_id"])
+    remove_position(row["user_id"], trade_id)
+    if closed.data:
+        record_trade("swing", closed.data[0])
 
     # 최종 메시지 출력
     date_now = datetime.now().strftime("%Y-%m-%d %H:%M")
@@ -838,17 +834,23 @@ async def swing_reason_exit(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"- 청산 근거: \"{reason_exit}\""
     )
 
+    # 불필요 메시지 삭제 (응답 후 백그라운드 일괄 삭제)
+    cleanup_later(context, update.effective_chat.id, [
+        *context.user_data.get("bot_msgs", []),
+        *context.user_data.get("user_msgs", []),
+    ])
+    context.user_data["bot_msgs"] = []
+    context.user_data["user_msgs"] = []
+
     reply_markup = ReplyKeyboardMarkup(LONG_MENU, resize_keyboard=True)
     await update.message.reply_text("청산완료", reply_markup=reply_markup)
+    await record_swing_close(row["user_id"], pnl_pct)
     return L_MENU
 
 # 취소
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    try:
-        await context.bot.delete_message(chat_id, update.message.message_id)
-    except:
-        pass
+    cleanup_later(context, chat_id, [update.message.message_id])
     
     reply_markup = ReplyKeyboardMarkup(MAIN_MENU, resize_keyboard=True)
     await update.message.reply_text("❌ 입력이 취소되었습니다. 메뉴에서 다시 시작하세요.", reply_markup=reply_markup)
@@ -859,6 +861,8 @@ cancel_handler = MessageHandler(filters.Text(["❌ 취소", "❌ 취소 / 뒤로
 
     # 단타 핸들러
 conv_scalp = ConversationHandler(
+    name="conv_scalp",
+    persistent=True,
     entry_points=[MessageHandler(filters.Text(["📓 일지작성(단타)"]), scalping_start)],
     states={
         IMAGE: [MessageHandler(filters.PHOTO, get_image)],
@@ -876,6 +880,8 @@ conv_scalp = ConversationHandler(
 )
 
 conv_long = ConversationHandler(
+    name="conv_long",
+    persistent=True,
     entry_points=[
         MessageHandler(filters.Text(["일지작성(장기)"]), swing_start),
         MessageHandler(filters.Text(["새 진입 기록"]), get_l_image)
@@ -903,6 +909,7 @@ conv_long = ConversationHandler(
 )
 
 telegram_app.add_handler(CommandHandler("start", start))
+telegram_app.add_handler(CommandHandler("report", report_command))
 telegram_app.add_handler(MessageHandler(filters.Text(["Checklist"]), show_checklist))
 telegram_app.add_handler(MessageHandler(filters.Text(["📊 통계보기"]), show_statistics))
 telegram_app.add_handler(MessageHandler(filters.Text(["🧠 AI 피드백"]), ai_feedback))
@@ -925,15 +932,26 @@ async def weekly_report(ctx):
     print(f"[DEBUG] Weekly job triggered at {now} (KST)")
     await safe_send_report(ctx, "week")
 
+async def save_persistence(ctx):
+    # 변경된 대화 상태 / user_data 를 주기적으로 일괄 기록
+    await telegram_app.update_persistence()
+
 async def monthly_report(ctx):
     now = datetime.now(KST).strftime("%Y-%m-%d %H:%M:%S")
     print(f"[DEBUG] Monthly job triggered at {now} (KST)")
     await safe_send_report(ctx, "month")
     
+feedback_pool = WorkerPool("feedback", run_feedback_job, workers=FEEDBACK_WORKERS, maxsize=FEEDBACK_QUEUE_SIZE)
+
 @app.on_event("startup")
 async def on_startup():
     await telegram_app.initialize()
     print("✅ Telegram Application initialized")
+    await http_client.start()
+    feedback_pool.start()
+    await warm_alias_cache()
+    await load_snapshots()
+    await daily_buckets.load()
 
     job_queue = telegram_app.job_queue
     job_queue.scheduler.configure(timezone=KST)
@@ -954,6 +972,37 @@ async def on_startup():
         name="monthly_report"
     )
 
+    schedule_prefetch(job_queue, SECTOR_CATEGORY_MAP.values())
+
+    await sector_store.load_from_db()
+    job_queue.run_repeating(
+        sector_store.flush_job,
+        interval=sector_store.SECTOR_FLUSH_INTERVAL,
+        first=sector_store.SECTOR_FLUSH_INTERVAL,
+        name="sector_candles_flush"
+    )
+
+    job_queue.run_repeating(
+        daily_buckets.flush_job,
+        interval=daily_buckets.BUCKET_FLUSH_INTERVAL,
+        first=daily_buckets.BUCKET_FLUSH_INTERVAL,
+        name="daily_buckets_flush"
+    )
+
+    job_queue.run_repeating(
+        user_stats.reconcile_job,
+        interval=user_stats.USER_STATS_RECONCILE_INTERVAL,
+        first=user_stats.USER_STATS_RECONCILE_INTERVAL,
+        name="user_stats_reconcile"
+    )
+
+    job_queue.run_repeating(
+        save_persistence,
+        interval=persistence.update_interval,
+        first=persistence.update_interval,
+        name="save_persistence"
+    )
+
     for job in job_queue.jobs():
         aps_job = getattr(job, "aps_job", None)
         if aps_job:
@@ -966,7 +1015,18 @@ async def on_startup():
     
 @app.on_event("shutdown")
 async def on_shutdown():
+    await update_processor.join()
+    await feedback_pool.stop()
+    await drain_cleanup()
+    await user_stats.reconcile()
+    await telegram_app.update_persistence()
+    await sector_digest.close_all()
+    await sector_store.flush()
+    await daily_buckets.flush()
     await telegram_app.shutdown()
+    await http_client.close()
+    db.shutdown()
+    charts.shutdown()
     print("🛑 Telegram Application shutdown")
 
 @app.post("/webhook")
@@ -977,74 +1037,37 @@ async def webhook(request: Request):
             print("⚠️ Webhook called with empty body")
             return JSONResponse(content={"ok": False, "error": "Empty body"}, status_code=400)
         try:
-            data = await request.json()
+            data = json.loads(raw_body)
         except Exception as e:
             print("⚠️ JSON decode error:", e, "raw_body=", raw_body)
             return JSONResponse(content={"ok": False, "error": "Invalid JSON"}, status_code=400)
 
         update = Update.de_json(data, telegram_app.bot)
-        await telegram_app.process_update(update)
+        # 채팅별 순서를 지키면서 채팅 간에는 동시 처리
+        try:
+            if WEBHOOK_QUEUE:
+                # 채팅별 큐에 넣고 바로 200 응답
+                update_processor.enqueue(update, telegram_app.process_update(update))
+            else:
+                await update_processor.submit(update, telegram_app.process_update(update))
+        except asyncio.QueueFull:
+            # 503 → 텔레그램이 나중에 재전송
+            print("⚠️ Webhook queue full, update", update.update_id, "rejected")
+            return JSONResponse(content={"ok": False, "error": "Queue full"}, status_code=503)
         return JSONResponse(content={"ok": True}, status_code=200)
     
     except Exception as e:
         print("❌ Webhook error:", e)
         return JSONResponse(content={"ok": False, "error": str(e)}, status_code=500)
 
-last_called = {}
-last_global_call = None
-
-async def get_top3_tokens(category_id: str):
-    global last_global_call
-    now = datetime.now()
-    
-    if category_id in last_called and (now - last_called[category_id]).seconds < 60:
-        print(f"[Skip] {category_id} 최근 호출 있음 → API 호출 생략")
-        return []
-
-    if last_global_call and (now - last_global_call).seconds < 1:
-        wait_time = 1 - (now - last_global_call).seconds
-        print(f"[Global Cooldown] {wait_time}초 대기")
-        await asyncio.sleep(wait_time)
-    
-    url = f"{COINGECKO_API}/coins/markets"
-    params = {
-        "vs_currency": "usd",
-        "category": category_id,
-        "order": "price_change_percentage_24h_desc",
-        "per_page": 50,
-        "page": 1
+@app.get("/webhook/stats")
+async def webhook_stats():
+    return {
+        "queue_mode": WEBHOOK_QUEUE,
+        "processor": update_processor.stats(),
+        "sender": send_scheduler.stats(),
+        "feedback": feedback_pool.stats(),
     }
-    print(f"[Coingecko Call] {datetime.now()} | category={category_id}")
-    
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        r = await client.get(url, params=params)
-        print(f"[Coingecko Response] status={r.status_code}")
-        if r.status_code == 429:
-            print("❌ API rate limit (429) 발생")
-            return []
-        r.raise_for_status()
-        coins = r.json()
-        
-    last_called[category_id] = now
-    last_global_call = now
-    
-    coins_sorted = sorted(
-        coins,
-        key=lambda c: c.get("price_change_percentage_24h", 0),
-        reverse=True
-    )
-
-    seen = set()
-    unique_coins = []
-    for coin in coins_sorted:
-        sym = coin.get("symbol", "").upper()
-        if sym not in seen:
-            seen.add(sym)
-            unique_coins.append(coin)
-        if len(unique_coins) == 3:
-            break
-
-    return unique_coins
 
 async def send_top3_to_telegram(bot, category_id: str, coins: list):
     print(f"[Telegram Send] {datetime.now()} | category={category_id} | coins={len(coins)}")
@@ -1068,7 +1091,8 @@ async def send_top3_to_telegram(bot, category_id: str, coins: list):
     if not coins:
         await bot.send_message(
             chat_id=TELEGRAM_CHAT_ID,
-            text=f"📊 {display_name} 카테고리에서 코인을 찾지 못했습니다."
+            text=f"📊 {display_name} 카테고리에서 코인을 찾지 못했습니다.",
+            rate_limit_args=BROADCAST
         )
         return
 
@@ -1083,9 +1107,29 @@ async def send_top3_to_telegram(bot, category_id: str, coins: list):
     await bot.send_message(
         chat_id=TELEGRAM_CHAT_ID,
         text="\n".join(msg_lines),
-        parse_mode="HTML"
+        parse_mode="HTML",
+        rate_limit_args=BROADCAST
     )
 
+SECTOR_CATEGORY_MAP = {
+    "SOLANA.C": "solana-ecosystem",
+    "BNBCHAIN.C": "binance-smart-chain",
+    "ETHEREUM.C": "ethereum-ecosystem",
+    "STABLE.C": "stablecoins",
+    "STABLE.C.D": "stablecoins",
+    "LAYER1.C": "layer-1",
+    "DEPIN.C": "depin",
+    "MEME.C": "meme-token",
+    "EXCHANGES.C": "centralized-exchange-token-cex",
+    "AI.C": "artificial-intelligence",
+    "RWA.C": "real-world-assets-rwa",
+    "WORLDLIBERTY.C": "world-liberty-financial-portfolio",
+    "POLKADOT.C": "dot-ecosystem",
+}
+
+SECTOR_ALERT_WINDOW = float(os.getenv("SECTOR_ALERT_WINDOW", "60"))   # 초
+last_sector_post = {}
+
 @app.post("/sector")
 async def sector_webhook(request: Request):
     try:
@@ -1104,25 +1148,20 @@ async def sector_webhook(request: Request):
         message = data.get("message") 
 
         if message == "UP":
-        
-            mapping = {
-                "SOLANA.C": "solana-ecosystem",
-                "BNBCHAIN.C": "binance-smart-chain",
-                "ETHEREUM.C": "ethereum-ecosystem",
-                "STABLE.C": "stablecoins",
-                "STABLE.C.D": "stablecoins",
-                "LAYER1.C": "layer-1",
-                "DEPIN.C": "depin",
-                "MEME.C": "meme-token",
-                "EXCHANGES.C": "centralized-exchange-token-cex",
-                "AI.C": "artificial-intelligence",
-                "RWA.C": "real-world-assets-rwa",
-                "WORLDLIBERTY.C": "world-liberty-financial-portfolio",
-                "POLKADOT.C": "dot-ecosystem",
-            }
-            category_id = mapping.get(symbol)
+            category_id = SECTOR_CATEGORY_MAP.get(symbol)
             if category_id:
-                coins = await get_top3_tokens(category_id)
+                # 짧은 시간 안의 같은 카테고리 중복 알림은 한 번만 게시
+                now = datetime.now()
+                last = last_sector_post.get(category_id)
+                if last and (now - last).total_seconds() < SECTOR_ALERT_WINDOW:
+                    print(f"[Skip] {category_id} 중복 알림 → 게시 생략")
+                    return JSONResponse(content={"ok": True, "deduped": True})
+                last_sector_post[category_id] = now
+
+                # 선조회된 메모리 테이블에서 바로 응답, 없을 때(cold start)만 조회
+                coins = peek_top3_tokens(category_id)
+                if coins is None:
+                    coins = await get_top3_tokens(category_id)
                 await send_top3_to_telegram(telegram_app.bot, category_id, coins)
 
         return JSONResponse(content={"ok": True})
@@ -1145,6 +1184,35 @@ SECTOR_NAME_MAP = {
     "POLKADOT.C": "폴카닷"
 }
 
+SECTOR_DIGEST_WINDOW = float(os.getenv("SECTOR_DIGEST_WINDOW", "90"))   # 초
+
+def sector_icon(pct):
+    if abs(pct) >= 1:
+        return "🔥"
+    elif pct < -1:
+        return "📉"
+    else:
+        return "🧊"
+
+async def send_sector_digest(candle_dt, changes):
+    # 변동률 내림차순 한 메시지로 전송
+    day = sector_store.trading_day(candle_dt)
+    lines = [f"📊 섹터 4H 변동률 ({candle_dt.astimezone(KST):%m/%d %H:%M} KST)\n"]
+    for symbol, (pct, ref_day) in sorted(changes.items(), key=lambda x: x[1][0], reverse=True):
+        tname = SECTOR_NAME_MAP.get(symbol, symbol)
+        line = f"{sector_icon(pct)} {tname}: {pct:.2f}%"
+        if ref_day != day:
+            line += f" ({ref_day:%m/%d} 기준)"
+        lines.append(line)
+
+    await telegram_app.bot.send_message(
+        chat_id=TELEGRAM_CHAT_ID,
+        text="\n".join(lines),
+        rate_limit_args=BROADCAST
+    )
+
+sector_digest = SectorDigest(SECTOR_NAME_MAP.keys(), SECTOR_DIGEST_WINDOW, send_sector_digest)
+
 @app.post("/sector_candle")
 async def sector_candle(request: Request):
     data = await request.json()
@@ -1159,84 +1227,20 @@ async def sector_candle(request: Request):
     dt_utc = datetime.fromisoformat(candle_time.replace("Z", "+00:00"))
     dt_kst = dt_utc.astimezone(KST)
     
-    #
-    safe_supabase_call(
-        supabase.table("sector_candles").upsert(
-            {
-                "symbol": symbol,
-                "candle_time": dt_utc.isoformat(), 
-                "candle_interval": str(candle_interval),
-                "close": close
-            },
-            on_conflict="symbol,candle_interval,candle_time"
-        )
-    )
-
-    rows = safe_supabase_call(
-        supabase.table("sector_candles")
-        .select("id, candle_time")
-        .eq("symbol", symbol)
-        .eq("candle_interval", candle_interval)
-        .order("candle_time", desc=True)
-    )
+    # 메모리 링 버퍼에 반영 (sector_candles 기록은 flush_job 에서 일괄 처리)
+    sector_store.add_candle(symbol, candle_interval, dt_utc, close)
 
-    
-    
     # 1D 
     if candle_interval == "1D":
-        if rows and rows.data and len(rows.data) > 1:
-            to_delete = [r["id"] for r in rows.data[1:]]
-            safe_supabase_call(
-                supabase.table("sector_candles").delete().in_("id", to_delete)
-            )
         print(f"[Daily Ref] {symbol} 1D 기준가 저장 (KST {dt_kst}): {close}")
         return JSONResponse(content={"ok": True})
 
     # 4H CAL
     if candle_interval == "240":
-        if rows and rows.data and len(rows.data) > 3:
-            to_delete = [r["id"] for r in rows.data[3:]]
-            safe_supabase_call(
-                supabase.table("sector_candles").delete().in_("id", to_delete)
-            )
-            
-        if dt_kst.hour < 9:  
-            # "어제 09:00 ~ 오늘 08:59"
-            start = datetime(dt_kst.year, dt_kst.month, dt_kst.day, 9, 0, tzinfo=KST) - timedelta(days=1)
-        else:
-            # "오늘 09:00 ~ 내일 08:59"
-            start = datetime(dt_kst.year, dt_kst.month, dt_kst.day, 9, 0, tzinfo=KST)
-        end = start + timedelta(days=1) - timedelta(seconds=1)
-        
-        ref = safe_supabase_call(
-            supabase.table("sector_candles")
-            .select("close")
-            .eq("symbol", symbol)
-            .eq("candle_interval", "1D")
-            .gte("candle_time", start.isoformat())
-            .lt("candle_time", end.isoformat())
-            .order("candle_time", desc=True)
-            .limit(1)
-        )
-
-        if ref and ref.data:
-            ref_close = float(ref.data[0]["close"])
-            pct = (close - ref_close) / ref_close * 100
-
-            if abs(pct) >= 1:
-                icon = "🔥"
-            elif pct < -1:
-                icon = "📉"
-            else:
-                icon = "🧊"
-            tname = SECTOR_NAME_MAP.get(symbol, symbol)
-            msg = f"{icon} {tname} 섹터\n현재 변동률: {pct:.2f}%"
-            await telegram_app.bot.send_message(
-                chat_id=TELEGRAM_CHAT_ID,
-                text=msg
-            )
-        else:
-            print(f"[icon] {symbol} 기준가(1D) 없음")
+        # (symbol, KST 거래일) 기준가 인덱스 조회 → 같은 캔들 시간 다이제스트에 모음
+        change = sector_store.sector_change(symbol, close, dt_utc)
+        if change is not None:
+            sector_digest.add(dt_utc, symbol, change)
 
     return JSONResponse(content={"ok": True})
 
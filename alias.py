@@ -0,0 +1,99 @@
+# alias.py
+import os
+import random
+from collections import OrderedDict
+from db import supabase, supabase_call, safe_supabase_call, iter_rows
+
+ALIAS_CACHE_SIZE = int(os.getenv("ALIAS_CACHE_SIZE", "10000"))
+
+# ====== 별칭 생성기 ======
+ADJECTIVES = ["불타는", "날쌘", "예리한", "강인한", "차가운", "뜨거운", "빠른", "은밀한", "화끈한", "거대한", "섹시한", "냉정한", "영리한", "잔혹한", "고독한", "거친", "맹렬한", "전설의 ", "저주받은", "깜찍한", "엉뚱한", "상큼한", "도도한", "노련한"]
+ANIMALS = ["곰", "호랑이", "코브라", "매", "황소", "늑대", "독수리", "상어", "팬더", "사자", "부엉이", "고양이", "아깽이", "강아지", "개미", "불개미", "벌꿀오소리", "얼룩말", "캥거루", "침팬치", "여우", "고래", "돌고래", "해파리", "펭귄", "물개", "까마귀", "앵무새", "공작새", "참새", "악어", "도마뱀", "개구리", "장수말벌", "풍뎅이"]
+
+def generate_alias(user_id: int) -> str:
+    last4 = str(user_id)[-4:]
+    adj = random.choice(ADJECTIVES)
+    animal = random.choice(ANIMALS)
+    return f"{adj}{animal}-{last4}"
+
+
+# ====== 별칭 캐시 (LRU) ======
+_cache = OrderedDict()
+
+def _cache_get(user_id):
+    alias = _cache.get(user_id)
+    if alias is not None:
+        _cache.move_to_end(user_id)
+    return alias
+
+def _cache_put(user_id, alias):
+    _cache[user_id] = alias
+    _cache.move_to_end(user_id)
+    while len(_cache) > ALIAS_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+def fallback_alias(user_id):
+    return f"유저{user_id}"
+
+
+async def warm_alias_cache():
+    # PostgREST 행 제한(1000)을 넘도록 페이지 단위로 ALIAS_CACHE_SIZE 까지 읽음
+    count = 0
+    try:
+        async for row in iter_rows(lambda: supabase.table("user_alias").select("user_id, alias").order("user_id")):
+            _cache_put(row["user_id"], row["alias"])
+            count += 1
+            if count >= ALIAS_CACHE_SIZE:
+                break
+    except Exception as e:
+        print("❌ Supabase error:", e)
+    print(f"[Alias] 캐시 워밍 완료: {count}건")
+
+
+# ====== 별칭 조회 ======
+async def resolve_aliases(user_ids):
+    user_ids = set(user_ids)
+    result = {}
+    missing = []
+    for uid in user_ids:
+        alias = _cache_get(uid)
+        if alias is None:
+            missing.append(uid)
+        else:
+            result[uid] = alias
+
+    # 캐시에 없는 유저는 in_ 쿼리 한 번으로 조회
+    if missing:
+        response = await safe_supabase_call(
+            supabase.table("user_alias").select("user_id, alias").in_("user_id", missing)
+        )
+        for row in (response.data if response else []):
+            _cache_put(row["user_id"], row["alias"])
+            result[row["user_id"]] = row["alias"]
+
+    for uid in user_ids:
+        result.setdefault(uid, fallback_alias(uid))
+    return result
+
+
+async def get_or_create_alias(user_id: int):
+    alias = _cache_get(user_id)
+    if alias is not None:
+        return alias
+
+    # 신규 유저는 upsert 한 번으로 생성 (이미 있으면 무시)
+    alias = generate_alias(user_id)
+    response = await supabase_call(
+        supabase.table("user_alias").upsert(
+            {"user_id": user_id, "alias": alias},
+            on_conflict="user_id",
+            ignore_duplicates=True
+        )
+    )
+    if response.data:
+        alias = response.data[0]["alias"]
+        _cache_put(user_id, alias)
+        return alias
+
+    # 캐시에서 밀려난 기존 유저
+    return (await resolve_aliases([user_id]))[user_id]
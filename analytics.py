@@ -0,0 +1,79 @@
+# analytics.py
+import numpy as np
+
+EMPTY_STATS = {"count": 0, "win": 0, "lose": 0, "win_rate": 0,
+               "total": 0, "avg": 0, "pf": 0, "pf_eval": "N/A"}
+
+
+# ====== 수익지수(PF) 평가 ======
+def pf_eval(pf):
+    if pf == float("inf"):
+        return "∞ 무손실"
+    elif pf >= 2:
+        return "✅ 양호"
+    elif pf >= 1:
+        return "⚠️ 보통"
+    else:
+        return "❌ 위험"
+
+
+# ====== 집계값 → 통계 ======
+def stats_from_totals(count, win, lose, gross_profit, gross_loss, total):
+    if not count:
+        return dict(EMPTY_STATS)
+
+    pf = (gross_profit / gross_loss) if gross_loss > 0 else float("inf")
+    return {"count": int(count), "win": int(win), "lose": int(lose),
+            "win_rate": float(win / count * 100), "total": float(total),
+            "avg": float(total / count), "pf": float(pf), "pf_eval": pf_eval(pf)}
+
+
+# 부호별 분류: 0 = 손실, 1 = 본전, 2 = 수익
+def _classify(arr):
+    return (np.sign(arr) + 1).astype(np.intp)
+
+
+# ====== 통계 계산 ======
+def calc_stats(profits):
+    arr = np.asarray(profits, dtype=np.float64)
+    if arr.size == 0:
+        return dict(EMPTY_STATS)
+
+    cls = _classify(arr)
+    counts = np.bincount(cls, minlength=3)
+    sums = np.bincount(cls, weights=arr, minlength=3)
+    return stats_from_totals(arr.size, counts[2], counts[0], sums[2], -sums[0], sums.sum())
+
+
+def _factorize(keys):
+    # 숫자/문자열 배열은 np.unique 로 바로 코드화
+    if isinstance(keys, np.ndarray) and keys.dtype != object:
+        groups, codes = np.unique(keys, return_inverse=True)
+        return groups.tolist(), codes.ravel()
+
+    # 키 → 0..n-1 코드 (튜플, None 등 임의의 hashable 키 지원)
+    index = {}
+    codes = np.fromiter((index.setdefault(k, len(index)) for k in keys), dtype=np.intp)
+    return list(index), codes
+
+
+# ====== 그룹별 통계 (유저/스타일/종목 등) ======
+def calc_group_stats(keys, profits):
+    arr = np.asarray(profits, dtype=np.float64)
+    groups, codes = _factorize(keys)
+    if len(codes) != arr.size:
+        raise ValueError("keys 와 profits 의 길이가 다릅니다")
+    if not groups:
+        return {}
+
+    n = len(groups)
+    idx = codes * 3 + _classify(arr)
+    counts = np.bincount(idx, minlength=3 * n).reshape(n, 3)
+    sums = np.bincount(idx, weights=arr, minlength=3 * n).reshape(n, 3)
+    totals = counts.sum(axis=1)
+    pnl_sums = sums.sum(axis=1)
+
+    return {
+        key: stats_from_totals(totals[i], counts[i, 2], counts[i, 0], sums[i, 2], -sums[i, 0], pnl_sums[i])
+        for i, key in enumerate(groups)
+    }
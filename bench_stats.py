@@ -0,0 +1,78 @@
+# bench_stats.py
+# 통계 엔진 마이크로 벤치마크: python bench_stats.py
+import timeit
+import numpy as np
+from analytics import calc_stats, calc_group_stats
+
+
+# 기존 구현 (리스트 컴프리헨션 5회 순회)
+def legacy_calc_stats(profits):
+    if not profits:
+        return {"count": 0, "win": 0, "lose": 0, "win_rate": 0,
+                "total": 0, "avg": 0, "pf": 0, "pf_eval": "N/A"}
+
+    total = len(profits)
+    win = len([p for p in profits if p > 0])
+    lose = len([p for p in profits if p < 0])
+    gross_profit = sum([p for p in profits if p > 0])
+    gross_loss = abs(sum([p for p in profits if p < 0]))
+    win_rate = win / total * 100
+    avg = sum(profits) / total
+    total_profit = sum(profits)
+    pf = (gross_profit / gross_loss) if gross_loss > 0 else float("inf")
+
+    if pf == float("inf"):
+        pf_eval = "∞ 무손실"
+    elif pf >= 2:
+        pf_eval = "✅ 양호"
+    elif pf >= 1:
+        pf_eval = "⚠️ 보통"
+    else:
+        pf_eval = "❌ 위험"
+
+    return {"count": total, "win": win, "lose": lose, "win_rate": win_rate,
+            "total": total_profit, "avg": avg, "pf": pf, "pf_eval": pf_eval}
+
+
+def legacy_group_stats(keys, profits):
+    grouped = {}
+    for k, p in zip(keys, profits):
+        grouped.setdefault(k, []).append(p)
+    return {k: legacy_calc_stats(v) for k, v in grouped.items()}
+
+
+def check_same(a, b):
+    assert a["count"] == b["count"] and a["win"] == b["win"] and a["lose"] == b["lose"], (a, b)
+    for f in ("win_rate", "total", "avg", "pf"):
+        assert np.isclose(a[f], b[f]), (f, a, b)
+    assert a["pf_eval"] == b["pf_eval"], (a, b)
+
+
+def bench(n, repeat=5):
+    rng = np.random.default_rng(0)
+    arr = np.round(rng.normal(0.5, 8, n), 2)
+    profits = arr.tolist()
+    key_arr = rng.integers(0, 200, n)
+    keys = key_arr.tolist()
+
+    check_same(calc_stats(profits), legacy_calc_stats(profits))
+    check_same(calc_stats(arr), legacy_calc_stats(profits))
+    legacy_groups = legacy_group_stats(keys, profits)
+    for k, st in calc_group_stats(key_arr, arr).items():
+        check_same(st, legacy_groups[k])
+
+    number = max(1, 100_000 // n)
+    t_legacy = min(timeit.repeat(lambda: legacy_calc_stats(profits), number=number, repeat=repeat)) / number
+    t_list = min(timeit.repeat(lambda: calc_stats(profits), number=number, repeat=repeat)) / number
+    t_arr = min(timeit.repeat(lambda: calc_stats(arr), number=number, repeat=repeat)) / number
+    t_g_legacy = min(timeit.repeat(lambda: legacy_group_stats(keys, profits), number=number, repeat=repeat)) / number
+    t_g_new = min(timeit.repeat(lambda: calc_group_stats(key_arr, arr), number=number, repeat=repeat)) / number
+
+    print(f"n={n:>9,} | legacy {t_legacy*1e3:9.3f}ms | numpy(list) {t_list*1e3:9.3f}ms "
+          f"| numpy(array) {t_arr*1e3:9.3f}ms | group legacy {t_g_legacy*1e3:9.3f}ms "
+          f"| group numpy {t_g_new*1e3:9.3f}ms")
+
+
+if __name__ == "__main__":
+    for n in (1_000, 100_000, 1_000_000):
+        bench(n)
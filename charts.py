@@ -0,0 +1,89 @@
+# charts.py
+import os
+import asyncio
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib import font_manager, rcParams
+
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "1"))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "32"))
+
+# ====== 폰트 적용 (워커 프로세스에서도 import 시 적용) ======
+font_path = "font/NanumGothic-Regular.ttf"
+if os.path.exists(font_path):
+    font_manager.fontManager.addfont(font_path)
+    font_prop = font_manager.FontProperties(fname=font_path)
+    rcParams['font.family'] = font_prop.get_name()
+    rcParams['axes.unicode_minus'] = False
+else:
+    print(f"[WARN] Font file not found at {font_path}")
+
+
+# ====== 그래프 렌더링 (pyplot 전역 상태 없이 Figure API 사용) ======
+def render_pnl_chart(cum_pnls):
+    fig = Figure(figsize=(6,4))
+    ax = fig.add_subplot()
+    ax.plot(range(len(cum_pnls)), cum_pnls, marker="o")
+    ax.set_title("PNL 추이")
+    ax.set_xlabel("거래")
+    ax.set_ylabel("누적 PNL %")
+    ax.grid(True, linestyle="--", alpha=0.7)
+
+    buf = BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+RENDERERS = {
+    "pnl": render_pnl_chart,
+}
+
+def _render(chart_type, series):
+    return RENDERERS[chart_type](series)
+
+
+# ====== 워커 프로세스 풀 ======
+_pool = None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # 스레드가 떠 있는 프로세스에서 fork 하지 않도록 spawn 사용
+        _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# ====== 내용 기반 캐시 ======
+_cache = OrderedDict()
+
+def chart_key(chart_type, series):
+    arr = np.ascontiguousarray(series, dtype=np.float64)
+    digest = hashlib.sha256(chart_type.encode())
+    digest.update(arr.tobytes())
+    return digest.hexdigest()
+
+async def render_chart(chart_type, series):
+    series = np.ascontiguousarray(series, dtype=np.float64)
+    key = chart_key(chart_type, series)
+    if key in _cache:
+        _cache.move_to_end(key)
+        print(f"[Chart] 캐시 사용 ({chart_type}, {key[:12]})")
+        return _cache[key]
+
+    loop = asyncio.get_running_loop()
+    png = await loop.run_in_executor(_get_pool(), _render, chart_type, series)
+
+    _cache[key] = png
+    while len(_cache) > CHART_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return png
@@ -0,0 +1,161 @@
+# daily_buckets.py
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from db import supabase, safe_supabase_call, iter_rows
+
+# trade_daily_buckets 테이블: (day, user_id, style, side, symbol) 당 한 행
+#   day: KST 날짜 (단타 = created_at, 장기 = date_closed 기준)
+#   count, win, lose, gross_profit, gross_loss, total
+FIELDS = ("count", "win", "lose", "gross_profit", "gross_loss", "total")
+BUCKET_FLUSH_INTERVAL = float(os.getenv("BUCKET_FLUSH_INTERVAL", "5"))   # 초
+
+KST = ZoneInfo("Asia/Seoul")
+
+_days = {}       # date -> {(user_id, style, side, symbol): [count, win, lose, gross_profit, gross_loss, total]}
+_dirty = set()   # 테이블에 기록해야 하는 (day, key)
+
+
+# ====== 날짜 ======
+def parse_ts(value):
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    # 타임존 없는 값(datetime.now().isoformat() 로 기록된 date_closed)은 DB 와 같이 UTC 로 해석
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+def kst_day(value):
+    return parse_ts(value).astimezone(KST).date()
+
+
+# ====== 버킷 ======
+def _apply(day, key, pnl):
+    vals = _days.setdefault(day, {}).setdefault(key, [0, 0, 0, 0.0, 0.0, 0.0])
+    vals[0] += 1
+    vals[5] += pnl
+    if pnl > 0:
+        vals[1] += 1
+        vals[3] += pnl
+    elif pnl < 0:
+        vals[2] += 1
+        vals[4] -= pnl
+    _dirty.add((day, key))
+
+def _add_row(style, row):
+    pnl = row.get("pnl_pct")
+    ts = row.get("date_closed") if style == "swing" else row.get("created_at")
+    if pnl is None or ts is None:
+        return
+    key = (row["user_id"], style, row.get("side"), row.get("symbol") or "N/A")
+    _apply(kst_day(ts), key, float(pnl))
+
+def record_trade(style, row):
+    # 단타 기록(created_at) / 장기 청산(date_closed) 시 DB 가 돌려준 행으로 호출
+    _add_row(style, row)
+
+def iter_days(start_day, end_day):
+    # 기간 안의 (day, {key: vals}) — 날짜 수만큼만 조회
+    day = start_day
+    while day <= end_day:
+        buckets = _days.get(day)
+        if buckets:
+            yield day, buckets
+        day += timedelta(days=1)
+
+
+# ====== 테이블 ======
+def _to_row(day, key):
+    user_id, style, side, symbol = key
+    vals = _days[day][key]
+    return {"day": day.isoformat(), "user_id": user_id, "style": style, "side": side, "symbol": symbol,
+            **dict(zip(FIELDS, vals))}
+
+async def flush():
+    global _dirty
+    dirty, _dirty = _dirty, set()
+    if not dirty:
+        return
+    rows = [_to_row(day, key) for day, key in dirty]
+    response = await safe_supabase_call(
+        supabase.table("trade_daily_buckets").upsert(rows, on_conflict="day,user_id,style,side,symbol")
+    )
+    if response is None:
+        # 실패한 버킷은 다음 주기에 재시도
+        _dirty |= dirty
+
+async def flush_job(ctx):
+    await flush()
+
+async def load():
+    count = 0
+    async for row in iter_rows(lambda: supabase.table("trade_daily_buckets").select("*")
+                               .order("day").order("user_id").order("style").order("side").order("symbol")):
+        day = datetime.fromisoformat(str(row["day"])).date()
+        key = (row["user_id"], row["style"], row.get("side"), row.get("symbol") or "N/A")
+        loaded = [row.get(f) or 0 for f in FIELDS]
+        buckets = _days.setdefault(day, {})
+        if key in buckets:
+            # 로딩 중 기록된 매매는 테이블 값 위에 더함
+            buckets[key] = [a + b for a, b in zip(loaded, buckets[key])]
+        else:
+            buckets[key] = loaded
+        count += 1
+
+    if count == 0:
+        # 버킷 테이블이 비어 있으면 한 번만 원본 테이블에서 백필
+        await rebuild()
+        return
+    print(f"[Buckets] trade_daily_buckets {count}건 → {len(_days)}일 로드")
+
+    # 마지막 flush 이후 기록된 증분은 비정상 종료 시 사라지므로
+    # 테이블의 마지막 날(하루 여유)부터 오늘까지는 원본 테이블로 다시 계산
+    await recheck_since(max(_days) - timedelta(days=1))
+
+
+async def recheck_since(since_day):
+    today = datetime.now(KST).date()
+    old = {}
+    day = since_day
+    while day <= today:
+        old[day] = _days.pop(day, {})
+        day += timedelta(days=1)
+
+    start = datetime.combine(since_day, datetime.min.time(), tzinfo=KST).isoformat()
+    async for row in iter_rows(lambda: supabase.table("scalping_trades")
+                               .select("user_id, pnl_pct, side, symbol, created_at")
+                               .gte("created_at", start).order("created_at").order("id")):
+        _add_row("scalping", row)
+    async for row in iter_rows(lambda: supabase.table("swing_trades")
+                               .select("user_id, pnl_pct, side, symbol, date_closed")
+                               .gte("date_closed", start).order("trade_id")):
+        _add_row("swing", row)
+
+    # 다시 계산한 날짜에서 사라진 버킷은 0 으로 덮어씀
+    for day, buckets in old.items():
+        for key in buckets.keys() - _days.get(day, {}).keys():
+            _days.setdefault(day, {})[key] = [0, 0, 0, 0.0, 0.0, 0.0]
+            _dirty.add((day, key))
+    await flush()
+    print(f"[Buckets] {since_day} ~ {today} 원본 테이블로 재계산")
+
+
+# ====== 백필 (전체 재계산) ======
+async def rebuild():
+    _days.clear()
+    _dirty.clear()
+    async for row in iter_rows(lambda: supabase.table("scalping_trades")
+                               .select("user_id, pnl_pct, side, symbol, created_at").order("created_at").order("id")):
+        _add_row("scalping", row)
+    async for row in iter_rows(lambda: supabase.table("swing_trades")
+                               .select("user_id, pnl_pct, side, symbol, date_closed").order("trade_id")):
+        _add_row("swing", row)
+    rows = len(_dirty)
+    await flush()
+    print(f"[Buckets] 전체 재계산 완료: {len(_days)}일, {rows}개 버킷")
+
+
+if __name__ == "__main__":
+    # 백필: python daily_buckets.py
+    asyncio.run(rebuild())
@@ -0,0 +1,53 @@
+# db.py
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from supabase import create_client
+
+# ====== 환경 변수 ======
+url = os.getenv("SUPABASE_URL")
+key = os.getenv("SUPABASE_KEY")
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "8"))
+
+supabase = create_client(url, key)
+
+# supabase-py 는 동기 클라이언트 → 이벤트 루프를 막지 않도록 제한된 스레드풀에서 실행
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="supabase")
+
+
+# ====== 쿼리 실행 ======
+async def supabase_call(query):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, query.execute)
+
+
+async def safe_supabase_call(query):
+    try:
+        return await supabase_call(query)
+    except Exception as e:
+        print("❌ Supabase error:", e)
+        return None
+
+
+async def gather_calls(*queries, safe=True):
+    # 서로 독립적인 쿼리는 동시에 실행
+    call = safe_supabase_call if safe else supabase_call
+    return await asyncio.gather(*(call(q) for q in queries))
+
+
+async def iter_rows(make_query, page_size=1000):
+    # make_query() 는 매번 새 쿼리 빌더를 반환해야 함 (고유한 정렬 포함)
+    # 서버 max-rows 가 page_size 보다 작으면 모든 페이지가 짧게 오므로 빈 페이지에서만 종료
+    offset = 0
+    while True:
+        response = await supabase_call(make_query().range(offset, offset + page_size - 1))
+        rows = response.data or []
+        if not rows:
+            break
+        for row in rows:
+            yield row
+        offset += len(rows)
+
+
+def shutdown():
+    _executor.shutdown(wait=False)
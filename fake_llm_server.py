@@ -0,0 +1,81 @@
+# fake_llm_server.py
+# 로컬 가짜 SSE 서버 (chat completions 스트리밍 흉내)
+#   python fake_llm_server.py           → 서버만 실행, GPTS_API_URL=http://127.0.0.1:8099/v1/chat/completions
+#   python fake_llm_server.py --check   → 서버 + llm.stream_chat 으로 첫 토큰 / 전체 시간 측정
+import sys
+import json
+import time
+import asyncio
+
+HOST, PORT = "127.0.0.1", 8099
+TOKEN_DELAY = 0.05   # 토큰 사이 지연(초)
+
+REPLY = (
+    "1. 좋은 매매 습관 : 매매 2 (BTC 롱) 은 근거가 명확했습니다.\n"
+    "2. 나쁜 매매 습관 : 매매 1 (ETH 숏) 은 추격 진입이었습니다.\n"
+    "3. 실질적인 개선 방안 : 진입 전 체크리스트를 확인하세요.\n"
+    "- 가장 좋은 매매 번호: 2\n"
+    "- 가장 나쁜 매매 번호: 1\n"
+)
+
+
+async def handle(reader, writer):
+    # 요청 헤더 + 본문은 읽고 버림
+    headers = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in headers.decode().split("\r\n"):
+        if line.lower().startswith("content-length:"):
+            length = int(line.split(":", 1)[1])
+    if length:
+        await reader.readexactly(length)
+
+    writer.write(
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: text/event-stream\r\n"
+        b"Cache-Control: no-cache\r\n"
+        b"Connection: close\r\n\r\n"
+    )
+    for i in range(0, len(REPLY), 4):
+        chunk = {"choices": [{"delta": {"content": REPLY[i:i + 4]}}]}
+        writer.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await writer.drain()
+        await asyncio.sleep(TOKEN_DELAY)
+    writer.write(b"data: [DONE]\n\n")
+    await writer.drain()
+    writer.close()
+
+
+async def check():
+    import http_client
+    from llm import stream_chat
+    from feedback_cache import parse_best_worst
+
+    await http_client.start()
+    url = f"http://{HOST}:{PORT}/v1/chat/completions"
+    started = time.monotonic()
+    first = None
+    text = ""
+    async for piece in stream_chat([{"role": "user", "content": "test"}], url=url, api_key="test"):
+        if first is None:
+            first = time.monotonic() - started
+        text += piece
+    total = time.monotonic() - started
+    await http_client.close()
+
+    assert text == REPLY, text
+    assert parse_best_worst(text) == (2, 1)
+    print(f"첫 토큰 {first * 1000:.0f}ms / 전체 {total * 1000:.0f}ms / {len(text)}자 ✅")
+
+
+async def main():
+    server = await asyncio.start_server(handle, HOST, PORT)
+    print(f"가짜 SSE 서버: http://{HOST}:{PORT}/v1/chat/completions")
+    async with server:
+        if "--check" in sys.argv:
+            await check()
+        else:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
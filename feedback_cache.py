@@ -0,0 +1,68 @@
+# feedback_cache.py
+import os
+import re
+import json
+import time
+import hashlib
+from collections import OrderedDict
+
+FEEDBACK_CACHE_SIZE = int(os.getenv("FEEDBACK_CACHE_SIZE", "1000"))     # 보관할 사용자 수
+FEEDBACK_CACHE_TTL = float(os.getenv("FEEDBACK_CACHE_TTL", "86400"))    # 초
+
+# user_id -> {"fingerprint", "reply", "good", "bad", "records", "created"}
+# 매매 기록 / 청산 시 invalidate 되므로 남아 있는 항목은 현재 기록 묶음 기준의 피드백
+_cache = OrderedDict()
+_generations = {}   # user_id -> invalidate 횟수 (생성 중 들어온 매매 기록 감지용)
+
+
+# ====== 프롬프트에 들어간 기록의 지문 ======
+def fingerprint(records):
+    payload = json.dumps(records, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ====== 가장 좋은/나쁜 매매 번호 ======
+def parse_best_worst(reply):
+    good_match = re.search(r"가장\s*좋은\s*매매\s*번호\s*:\s*(\d+)", reply)
+    bad_match = re.search(r"가장\s*나쁜\s*매매\s*번호\s*:\s*(\d+)", reply)
+    good = int(good_match.group(1)) if good_match else None
+    bad = int(bad_match.group(1)) if bad_match else None
+    return good, bad
+
+
+# ====== 캐시 (LRU + TTL) ======
+def get(user_id, fp=None):
+    # fp 없이 조회하면 DB 조회 전 바로 응답할 때 (invalidate 로 최신성 보장)
+    entry = _cache.get(user_id)
+    if entry is None:
+        return None
+    if (fp is not None and entry["fingerprint"] != fp) or time.monotonic() - entry["created"] > FEEDBACK_CACHE_TTL:
+        del _cache[user_id]
+        return None
+    _cache.move_to_end(user_id)
+    return entry
+
+def generation(user_id):
+    # 기록 조회 전에 받아 두고 put 에 넘김
+    return _generations.get(user_id, 0)
+
+def put(user_id, fp, reply, good, bad, records, generation=None):
+    # 조회 후 새 매매 기록 / 청산이 있었으면 (generation 변경) 저장하지 않음
+    if generation is not None and generation != _generations.get(user_id, 0):
+        return
+    _cache[user_id] = {
+        "fingerprint": fp,
+        "reply": reply,
+        "good": good,
+        "bad": bad,
+        "records": records,   # 좋은/나쁜 매매 사진 전송용
+        "created": time.monotonic(),
+    }
+    _cache.move_to_end(user_id)
+    while len(_cache) > FEEDBACK_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+def invalidate(user_id):
+    # 새 매매 기록 / 청산 시 호출
+    _generations[user_id] = _generations.get(user_id, 0) + 1
+    _cache.pop(user_id, None)
@@ -0,0 +1,79 @@
+# http_client.py
+import os
+import asyncio
+from urllib.parse import urlsplit
+import httpx
+
+HTTP2 = os.getenv("HTTP2", "0") == "1"                                   # h2 패키지 필요
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "5"))            # 호스트별 동시 요청 수
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# ====== 타임아웃 프로필 ======
+TIMEOUTS = {
+    "market": httpx.Timeout(10.0, connect=5.0),   # CoinGecko 등 빠른 API
+    "llm": httpx.Timeout(30.0, connect=5.0),      # GPT 등 느린 API
+}
+
+_client = None
+_host_slots = {}
+
+
+def _http2_enabled():
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("[WARN] HTTP2=1 이지만 h2 패키지가 없어 HTTP/1.1 사용")
+        return False
+
+
+# ====== 수명 주기 (on_startup / on_shutdown) ======
+async def start():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=_http2_enabled(),
+            timeout=TIMEOUTS["market"],
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        print("✅ Shared HTTP client started")
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_client():
+    if _client is None:
+        raise RuntimeError("HTTP client is not started")
+    return _client
+
+
+# ====== 호스트별 동시 요청 제한 ======
+def host_slot(url):
+    host = urlsplit(str(url)).netloc
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    return slot
+
+async def request(method, url, profile="market", **kwargs):
+    async with host_slot(url):
+        return await get_client().request(method, url, timeout=TIMEOUTS[profile], **kwargs)
+
+async def stream_events(method, url, profile="llm", **kwargs):
+    # server-sent events: "data: ..." 줄의 내용을 도착하는 대로 yield
+    async with host_slot(url):
+        async with get_client().stream(method, url, timeout=TIMEOUTS[profile], **kwargs) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if line.startswith("data:"):
+                    yield line[5:].strip()
@@ -0,0 +1,32 @@
+# llm.py
+import os
+import json
+from contextlib import aclosing
+import http_client
+
+GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4o")
+
+
+# ====== chat completions (SSE 스트리밍) ======
+async def stream_chat(messages, model=GPT_MODEL, url=None, api_key=None):
+    # 응답 텍스트 조각을 도착하는 대로 yield (url 은 테스트용 가짜 서버로 교체 가능)
+    url = url or os.getenv("GPTS_API_URL")
+    api_key = api_key or os.getenv("GPTS_API_KEY")
+
+    events = http_client.stream_events(
+        "POST",
+        url,
+        profile="llm",
+        headers={"Authorization": f"Bearer {api_key}"},
+        json={"model": model, "messages": messages, "stream": True}
+    )
+    async with aclosing(events):
+        async for data in events:
+            if data == "[DONE]":
+                break
+            if not data:
+                continue
+            choices = json.loads(data).get("choices") or [{}]
+            content = choices[0].get("delta", {}).get("content")
+            if content:
+                yield content
@@ -0,0 +1,139 @@
+# market_data.py
+import os
+import time
+from datetime import datetime
+import http_client
+from ratelimit import TokenBucket
+from singleflight import SingleFlight
+
+COINGECKO_API = "https://api.coingecko.com/api/v3"
+MARKET_FRESH_TTL = float(os.getenv("MARKET_FRESH_TTL", "60"))      # 이 시간 안의 데이터는 그대로 사용
+MARKET_STALE_TTL = float(os.getenv("MARKET_STALE_TTL", "900"))     # 이 시간까지는 stale 응답 + 백그라운드 갱신
+# CoinGecko 무료(공개) API 한도에 맞춘 호출 예산
+COINGECKO_RATE_PER_MIN = float(os.getenv("COINGECKO_RATE_PER_MIN", "10"))
+COINGECKO_BURST = int(os.getenv("COINGECKO_BURST", "3"))
+
+coingecko_bucket = TokenBucket(rate=COINGECKO_RATE_PER_MIN / 60, capacity=COINGECKO_BURST)
+
+_cache = {}                 # category_id -> (fetched_at, coins)
+_flights = SingleFlight()   # 같은 카테고리 동시 조회는 한 번의 호출로 합침
+
+
+# ====== CoinGecko 호출 ======
+def top3_unique(coins):
+    coins_sorted = sorted(
+        coins,
+        key=lambda c: c.get("price_change_percentage_24h") or 0,
+        reverse=True
+    )
+
+    seen = set()
+    unique_coins = []
+    for coin in coins_sorted:
+        sym = coin.get("symbol", "").upper()
+        if sym not in seen:
+            seen.add(sym)
+            unique_coins.append(coin)
+        if len(unique_coins) == 3:
+            break
+
+    return unique_coins
+
+async def _fetch_top3_tokens(category_id: str):
+    await coingecko_bucket.acquire()
+
+    url = f"{COINGECKO_API}/coins/markets"
+    params = {
+        "vs_currency": "usd",
+        "category": category_id,
+        "order": "price_change_percentage_24h_desc",
+        "per_page": 50,
+        "page": 1
+    }
+    print(f"[Coingecko Call] {datetime.now()} | category={category_id}")
+
+    try:
+        r = await http_client.request("GET", url, profile="market", params=params)
+        print(f"[Coingecko Response] status={r.status_code}")
+        if r.status_code == 429:
+            print("❌ API rate limit (429) 발생")
+            return None
+        r.raise_for_status()
+        coins = r.json()
+    except Exception as e:
+        print(f"❌ Coingecko error ({category_id}):", e)
+        return None
+
+    top3 = top3_unique(coins)
+    _cache[category_id] = (time.monotonic(), top3)
+    return top3
+
+
+async def fetch_top3_tokens(category_id: str):
+    # 실패 시 None, 진행 중인 같은 카테고리 호출이 있으면 그 결과를 공유
+    return await _flights.do(category_id, _fetch_top3_tokens, category_id)
+
+
+# ====== 캐시 (stale-while-revalidate) ======
+def _refresh_in_background(category_id):
+    _flights.start(category_id, _fetch_top3_tokens, category_id)
+
+async def get_top3_tokens(category_id: str):
+    entry = _cache.get(category_id)
+    if entry:
+        fetched_at, coins = entry
+        age = time.monotonic() - fetched_at
+        if age < MARKET_FRESH_TTL:
+            return coins
+        if age < MARKET_STALE_TTL:
+            print(f"[Cache] {category_id} stale ({age:.0f}s) → 백그라운드 갱신")
+            _refresh_in_background(category_id)
+            return coins
+
+    coins = await fetch_top3_tokens(category_id)
+    if coins is None:
+        # 갱신 실패 시 오래된 데이터라도 사용
+        return entry[1] if entry else []
+    return coins
+
+def peek_top3_tokens(category_id: str):
+    # 네트워크 호출 없이 메모리 테이블만 조회 (없거나 너무 오래되면 None)
+    entry = _cache.get(category_id)
+    if entry and time.monotonic() - entry[0] < MARKET_STALE_TTL:
+        return entry[1]
+    return None
+
+
+# ====== 백그라운드 선조회 (job_queue) ======
+MARKET_PREFETCH = os.getenv("MARKET_PREFETCH", "1") == "1"
+MARKET_PREFETCH_INTERVAL = float(os.getenv("MARKET_PREFETCH_INTERVAL", "300"))   # 카테고리당 갱신 주기(초)
+MARKET_PREFETCH_SHARE = 0.8   # 호출 예산 중 선조회에 쓰는 비율 (나머지는 cold start 조회용)
+
+async def prefetch_job(ctx):
+    category_id = ctx.job.data
+    if await fetch_top3_tokens(category_id) is None:
+        print(f"[Prefetch] {category_id} 갱신 실패 → 기존 데이터 유지")
+
+def schedule_prefetch(job_queue, categories):
+    categories = list(dict.fromkeys(categories))
+    if not MARKET_PREFETCH or not categories:
+        return
+
+    # 전체 카테고리 갱신이 호출 예산 안에 들어오도록 주기 보정
+    min_interval = len(categories) / (coingecko_bucket.rate * MARKET_PREFETCH_SHARE)
+    interval = MARKET_PREFETCH_INTERVAL
+    if interval < min_interval:
+        print(f"[WARN] MARKET_PREFETCH_INTERVAL={interval}s 는 호출 예산 초과 → {min_interval:.0f}s 로 조정")
+        interval = min_interval
+
+    # 카테고리별로 시작 시점을 고르게 분산
+    step = interval / len(categories)
+    for i, category_id in enumerate(categories):
+        job_queue.run_repeating(
+            prefetch_job,
+            interval=interval,
+            first=1 + i * step,
+            data=category_id,
+            name=f"prefetch_{category_id}"
+        )
+    print(f"[Prefetch] {len(categories)}개 카테고리, 주기 {interval:.0f}s (간격 {step:.1f}s)")
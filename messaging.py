@@ -0,0 +1,214 @@
+# messaging.py
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from ratelimit import TokenBucket
+
+DELETE_BATCH_SIZE = 100   # deleteMessages 한 번에 최대 100개
+
+
+# ====== 메시지 정리 ======
+async def delete_messages(bot, chat_id, message_ids):
+    ids = [m for m in dict.fromkeys(message_ids) if m]
+    for i in range(0, len(ids), DELETE_BATCH_SIZE):
+        chunk = ids[i:i + DELETE_BATCH_SIZE]
+        try:
+            # Bot API deleteMessages: 한 번의 호출로 일괄 삭제 (없는 메시지는 건너뜀)
+            await bot.delete_messages(chat_id, chunk)
+        except Exception as e:
+            print(f"[Cleanup] deleteMessages 실패 → 개별 삭제로 대체: {e}")
+            await asyncio.gather(
+                *(bot.delete_message(chat_id, msg_id) for msg_id in chunk),
+                return_exceptions=True
+            )
+
+
+_cleanup_tasks = set()   # 진행 중인 삭제 작업 (종료 시 drain_cleanup 으로 마무리)
+
+def cleanup_later(context, chat_id, message_ids):
+    # 사용자 응답을 막지 않도록 백그라운드에서 삭제
+    # (Application.start() 를 쓰지 않으므로 PTB create_task 대신 직접 참조를 보관)
+    ids = list(message_ids)
+    if ids:
+        task = asyncio.create_task(delete_messages(context.bot, chat_id, ids))
+        _cleanup_tasks.add(task)
+        task.add_done_callback(_cleanup_tasks.discard)
+
+async def drain_cleanup():
+    while _cleanup_tasks:
+        await asyncio.gather(*_cleanup_tasks, return_exceptions=True)
+
+
+# ====== 전송 스케줄러 (Bot API rate limit) ======
+# - 전역 / 채팅별 토큰 버킷 (Telegram: 전역 ~30/s, 채팅당 ~1/s, 그룹·채널 20/min)
+# - 우선순위 레인: interactive(DM 응답) 가 broadcast(채널 리포트 등) 보다 먼저
+# - RetryAfter 는 해당 채팅(또는 전역)을 멈췄다가 재시도
+# - 아직 전송 전인 같은 메시지 수정(editMessageText)은 마지막 내용 하나로 합침
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))       # 초당
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))            # 개인 채팅 초당
+SEND_GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", "20")) / 60    # 그룹·채널 초당
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+SEND_CHAT_BUCKETS = 1000   # 채팅별 버킷 보관 수 (초과 시 가득 찬 버킷부터 정리)
+
+LANES = {"interactive": 0, "broadcast": 1}
+BROADCAST = {"lane": "broadcast"}   # bot.send_*(..., rate_limit_args=BROADCAST)
+COALESCE_ENDPOINTS = {"editMessageText", "editMessageCaption", "editMessageReplyMarkup"}
+CHAT_LIMITED_PREFIXES = ("send", "edit")   # 채팅별 버킷 적용 (삭제 / 콜백 응답은 전역 버킷만)
+
+
+def _retry_seconds(error):
+    retry_after = error.retry_after
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class SendScheduler(BaseRateLimiter):
+    def __init__(self, global_rate=SEND_GLOBAL_RATE, max_retries=SEND_MAX_RETRIES):
+        self.global_bucket = TokenBucket(rate=global_rate, capacity=max(1, int(global_rate)))
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._chat_paused = {}      # chat_id -> monotonic 재개 시각
+        self._paused_until = 0.0    # 전역 재개 시각
+        self._waiters = []          # heap (lane 우선순위, 순번, future)
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._dispatcher = None
+        self._pending_edits = {}    # (endpoint, chat_id, message_id) -> 대기 중인 수정
+        self._stats = {"sent": 0, "retried": 0, "coalesced": 0, "failed": 0}
+
+    async def initialize(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    # ---- 채팅별 버킷 ----
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= SEND_CHAT_BUCKETS:
+                for key in [k for k, b in self._chat_buckets.items()
+                            if not b._lock.locked() and b.wait_time() == 0]:
+                    del self._chat_buckets[key]
+            # 음수 chat_id / @username = 그룹·채널
+            group = str(chat_id).startswith(("-", "@"))
+            rate = SEND_GROUP_RATE if group else SEND_CHAT_RATE
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate=rate, capacity=1 if group else 3)
+        return bucket
+
+    # ---- 전역 버킷 (우선순위 순서로 토큰 배분) ----
+    async def _dispatch(self):
+        while True:
+            if not self._waiters:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            await self.global_bucket.acquire()
+            while self._waiters:
+                _, _, fut = heapq.heappop(self._waiters)
+                if not fut.done():
+                    fut.set_result(None)
+                    break
+
+    async def _acquire(self, lane, chat_id, endpoint):
+        if chat_id is not None:
+            pause = self._chat_paused.get(chat_id, 0) - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            if endpoint.startswith(CHAT_LIMITED_PREFIXES):
+                await self._chat_bucket(chat_id).acquire()
+
+        if self._dispatcher is None:
+            # initialize 전: 우선순위 없이 전역 버킷만 적용
+            await self.global_bucket.acquire()
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (LANES.get(lane, 0), next(self._seq), fut))
+        self._wake.set()
+        await fut
+
+    def _pause(self, chat_id, seconds):
+        until = time.monotonic() + seconds
+        if chat_id is None:
+            self._paused_until = max(self._paused_until, until)
+        else:
+            self._chat_paused[chat_id] = max(self._chat_paused.get(chat_id, 0), until)
+
+    async def _call(self, get_call, lane, chat_id, endpoint):
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(lane, chat_id, endpoint)
+            callback, args, kwargs = get_call()
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    self._stats["failed"] += 1
+                    raise
+                seconds = _retry_seconds(e)
+                print(f"[Send] {endpoint} chat={chat_id} 429 → {seconds:.0f}s 후 재시도")
+                self._stats["retried"] += 1
+                self._pause(chat_id, seconds)
+            else:
+                self._stats["sent"] += 1
+                return result
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        lane = (rate_limit_args or {}).get("lane", "interactive")
+        chat_id = data.get("chat_id")
+        message_id = data.get("message_id")
+
+        if endpoint not in COALESCE_ENDPOINTS or chat_id is None or message_id is None:
+            call = (callback, args, kwargs)
+            return await self._call(lambda: call, lane, chat_id, endpoint)
+
+        # 아직 전송되지 않은 같은 메시지 수정이 있으면 내용만 교체하고 그 결과를 공유
+        key = (endpoint, chat_id, message_id)
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            pending["call"] = (callback, args, kwargs)
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(pending["future"])
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        pending = self._pending_edits[key] = {"call": (callback, args, kwargs), "future": future}
+
+        def take_call():
+            # 전송 직전에 대기열에서 빼서 이후 수정은 새로 줄을 서게 함
+            if self._pending_edits.get(key) is pending:
+                del self._pending_edits[key]
+            return pending["call"]
+
+        try:
+            result = await self._call(take_call, lane, chat_id, endpoint)
+        except BaseException as e:
+            if self._pending_edits.get(key) is pending:
+                del self._pending_edits[key]
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        return {
+            **self._stats,
+            "waiting": sum(1 for _, _, f in self._waiters if not f.done()),
+            "pending_edits": len(self._pending_edits),
+            "chats": len(self._chat_buckets),
+        }
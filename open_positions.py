@@ -0,0 +1,55 @@
+# open_positions.py
+import os
+import asyncio
+from collections import OrderedDict
+from db import supabase, supabase_call
+
+OPEN_POSITIONS_CACHE_SIZE = int(os.getenv("OPEN_POSITIONS_CACHE_SIZE", "10000"))   # 보관할 사용자 수
+FIELDS = "trade_id, symbol, side, entry_price"
+
+# user_id -> {trade_id: row} (LRU)
+_index = OrderedDict()
+_locks = {}
+
+
+def _lock(user_id):
+    return _locks.setdefault(user_id, asyncio.Lock())
+
+def _put(user_id, positions):
+    _index[user_id] = positions
+    _index.move_to_end(user_id)
+    while len(_index) > OPEN_POSITIONS_CACHE_SIZE:
+        evicted, _ = _index.popitem(last=False)
+        _locks.pop(evicted, None)
+
+
+# ====== 조회 ======
+async def get_open_positions(user_id):
+    # 처음 한 번만 해당 사용자의 열린 포지션을 서버에서 필터링해 가져오고 이후는 메모리 조회
+    async with _lock(user_id):
+        positions = _index.get(user_id)
+        if positions is None:
+            response = await supabase_call(
+                supabase.table("swing_trades").select(FIELDS)
+                .eq("user_id", user_id)
+                .is_("exit_price", None)
+                .order("trade_id")
+            )
+            positions = {row["trade_id"]: row for row in response.data}
+            _put(user_id, positions)
+        else:
+            _index.move_to_end(user_id)
+        return list(positions.values())
+
+
+# ====== 증분 업데이트 (원본 테이블에 기록한 뒤 호출) ======
+def add_position(user_id, row):
+    # 아직 로드되지 않은 사용자는 다음 조회 때 DB 에서 가져옴
+    positions = _index.get(user_id)
+    if positions is not None:
+        positions[row["trade_id"]] = {k: row.get(k) for k in ("trade_id", "symbol", "side", "entry_price")}
+
+def remove_position(user_id, trade_id):
+    positions = _index.get(user_id)
+    if positions is not None:
+        positions.pop(trade_id, None)
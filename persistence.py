@@ -0,0 +1,182 @@
+# persistence.py
+import os
+import json
+import time
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from telegram.ext import BasePersistence, PersistenceInput
+
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "bot_state.sqlite3")
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "10"))   # 초, 변경분 일괄 기록 주기
+PERSISTENCE_TTL = float(os.getenv("PERSISTENCE_TTL", str(2 * 24 * 3600)))  # 이보다 오래된 작성 중 상태는 버림
+
+
+# ====== 로컬 SQLite(WAL) 기반 대화 상태 / user_data 저장소 ======
+# - 대화 상태(conv_scalp, conv_long): 시작 시 한 번에 로드 (작은 테이블)
+# - user_data: 시작 시 로드하지 않고 유저별 첫 업데이트 때 lazy 로드
+# - 기록: Application.update_persistence 가 주기적으로 넘겨주는 변경분을 한 트랜잭션으로 기록
+class SQLitePersistence(BasePersistence):
+    def __init__(self, path=PERSISTENCE_PATH, update_interval=PERSISTENCE_INTERVAL, ttl=PERSISTENCE_TTL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.ttl = ttl
+        # sqlite 연결은 전용 스레드 하나에서만 사용
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn = None
+        self._loaded_users = set()
+        self._pending_users = {}   # user_id -> data (None 이면 삭제)
+        self._pending_convs = {}   # (name, key) -> state (None 이면 삭제)
+        self._flush_task = None
+
+    # ====== DB ======
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_data ("
+                "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (name, key))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _write(self, users, convs):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT INTO user_data (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at",
+                [(uid, json.dumps(data, ensure_ascii=False, default=str), now)
+                 for uid, data in users.items() if data is not None],
+            )
+            conn.executemany(
+                "DELETE FROM user_data WHERE user_id = ?",
+                [(uid,) for uid, data in users.items() if data is None],
+            )
+            conn.executemany(
+                "INSERT INTO conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name, key) DO UPDATE SET state=excluded.state, updated_at=excluded.updated_at",
+                [(name, key, json.dumps(state), now)
+                 for (name, key), state in convs.items() if state is not None],
+            )
+            conn.executemany(
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                [(name, key) for (name, key), state in convs.items() if state is None],
+            )
+
+    def _load_user(self, user_id):
+        row = self._connect().execute(
+            "SELECT data FROM user_data WHERE user_id = ? AND updated_at >= ?",
+            (user_id, time.time() - self.ttl),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _load_conversations(self, name):
+        rows = self._connect().execute(
+            "SELECT key, state FROM conversations WHERE name = ? AND updated_at >= ?",
+            (name, time.time() - self.ttl),
+        ).fetchall()
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    # ====== 일괄 기록 ======
+    def _schedule_flush(self):
+        # update_persistence 한 번에 들어오는 변경분을 모아 한 트랜잭션으로 기록
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+    async def _flush_pending(self):
+        await asyncio.sleep(0)
+        while self._pending_users or self._pending_convs:
+            users, self._pending_users = self._pending_users, {}
+            convs, self._pending_convs = self._pending_convs, {}
+            try:
+                await self._run(self._write, users, convs)
+            except Exception as e:
+                print("❌ Persistence write error:", e)
+                break
+
+    async def flush(self):
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._flush_pending()
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ====== user_data ======
+    async def get_user_data(self):
+        # 재시작 시 전체 로드 없음 → refresh_user_data 에서 유저별로 로드
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        data = await self._run(self._load_user, user_id)
+        if data:
+            for k, v in data.items():
+                user_data.setdefault(k, v)
+
+    async def update_user_data(self, user_id, data):
+        self._loaded_users.add(user_id)
+        self._pending_users[user_id] = data
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id):
+        self._pending_users[user_id] = None
+        self._schedule_flush()
+
+    # ====== 대화 상태 ======
+    async def get_conversations(self, name):
+        return await self._run(self._load_conversations, name)
+
+    async def update_conversation(self, name, key, new_state):
+        self._pending_convs[(name, json.dumps(list(key)))] = new_state
+        self._schedule_flush()
+
+    # ====== 사용하지 않는 저장소 ======
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,34 @@
+# ratelimit.py
+import asyncio
+import time
+
+
+# ====== 토큰 버킷 ======
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate              # 초당 충전 토큰 수
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()   # 대기자는 도착 순서대로
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self):
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep(self.wait_time())
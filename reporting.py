@@ -1,150 +1,350 @@
 # reporting.py
 import os
+import math
+import heapq
+import asyncio
+from itertools import accumulate
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-import matplotlib.pyplot as plt
-from matplotlib import font_manager, rcParams
-from io import BytesIO
-from supabase import create_client
 from telegram import InputFile
-import numpy as np
-from collections import defaultdict
+from db import supabase, iter_rows
+from alias import resolve_aliases
+from analytics import stats_from_totals
+from charts import render_chart
+from messaging import BROADCAST
+import daily_buckets
+from daily_buckets import parse_ts
+from array import array
 
 # ====== 환경 변수 ======
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHANNEL_ID = int(os.getenv("CHANNEL_ID"))
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_KEY")
-supabase = create_client(url, key)
-
-# ====== 폰트 적용 ======
-font_path = "font/NanumGothic-Regular.ttf"  
-if os.path.exists(font_path):
-    font_prop = font_manager.FontProperties(fname=font_path)
-    rcParams['font.family'] = font_prop.get_name()   
-    rcParams['axes.unicode_minus'] = False
-    print(f"[INFO] Matplotlib font set to: {font_prop.get_name()}")
-else:
-    print(f"[WARN] Font file not found at {font_path}")
-
-
-# ====== 통계 계산 ======
-def calc_stats(profits):
-    if not profits:
-        return {"count": 0, "win": 0, "lose": 0, "win_rate": 0,
-                "total": 0, "avg": 0, "pf": 0, "pf_eval": "N/A"}
-    
-    total = len(profits)
-    win = len([p for p in profits if p > 0])
-    lose = len([p for p in profits if p < 0])
-    gross_profit = sum([p for p in profits if p > 0])
-    gross_loss = abs(sum([p for p in profits if p < 0]))
-    win_rate = win / total * 100
-    avg = sum(profits) / total
-    total_profit = sum(profits)
-    pf = (gross_profit / gross_loss) if gross_loss > 0 else float("inf")
-
-    if pf == float("inf"):
-        pf_eval = "∞ 무손실"
-    elif pf >= 2:
-        pf_eval = "✅ 양호"
-    elif pf >= 1:
-        pf_eval = "⚠️ 보통"
-    else:
-        pf_eval = "❌ 위험"
-
-    return {"count": total, "win": win, "lose": lose, "win_rate": win_rate,
-            "total": total_profit, "avg": avg, "pf": pf, "pf_eval": pf_eval}
 
 # ====== 데이터 조회 ======
-def fetch_trades(period="week"):
+REPORT_PAGE_SIZE = int(os.getenv("REPORT_PAGE_SIZE", "1000"))
+# snapshot = 매매 기록 시 갱신되는 메모리 집계 사용, full = 매번 테이블 전체 재집계
+REPORT_MODE = os.getenv("REPORT_MODE", "snapshot")
+REPORT_VERIFY = os.getenv("REPORT_VERIFY", "0") == "1"   # 1 이면 전송 때마다 두 방식 결과 비교
+
+def period_start(period="week"):
     now = datetime.now(ZoneInfo("Asia/Seoul"))
-    
+
     if period == "week":
-        start = now - timedelta(days=7)
+        return now - timedelta(days=7)
     elif period == "month":
-        start = now - timedelta(days=30)
+        return now - timedelta(days=30)
+    return None
+
+async def iter_trades(period="week", page_size=REPORT_PAGE_SIZE):
+    # PostgREST 행 제한을 넘지 않도록 정렬된 range 페이지 단위로 스트리밍
+    # ("scalping" | "swing", row) 를 한 행씩 yield
+    start = period_start(period)
+
+    def scalping_query():
+        query = supabase.table("scalping_trades").select("user_id,pnl_pct,side,symbol,created_at")
+        if start: query = query.gte("created_at", start.isoformat())
+        return query.order("created_at").order("id")   # created_at 동률이 페이지 경계에서 빠지거나 겹치지 않도록
+
+    def swing_query():
+        query = supabase.table("swing_trades").select("trade_id,user_id,pnl_pct,side,symbol,date_closed")
+        if start: query = query.gte("date_closed", start.isoformat())
+        return query.order("trade_id")
+
+    async for row in iter_rows(scalping_query, page_size):
+        yield "scalping", row
+    async for row in iter_rows(swing_query, page_size):
+        yield "swing", row
+
+# ====== 리포트 집계 (한 번 순회) ======
+class ReportAggregator:
+    STYLES = ("scalping", "swing")
+
+    def __init__(self):
+        # 스타일별 [count, win, lose, gross_profit, gross_loss, total]
+        self.styles = {style: [0, 0, 0, 0.0, 0.0, 0.0] for style in self.STYLES}
+        self.sides = {"롱": 0, "숏": 0}
+        self.symbols = {}   # symbol -> [win, total]
+        self.users = {}     # user_id -> [pnl 합계, 거래 수]
+        self.cum_pnls = array("d")
+        self._running = 0.0
+
+    def add(self, style, row):
+        pnl = row.get("pnl_pct")
+        side = row.get("side")
+        if side in self.sides:
+            self.sides[side] += 1
+
+        user = self.users.setdefault(row["user_id"], [0.0, 0])
+        user[0] += pnl if pnl is not None else 0
+        user[1] += 1
+
+        if pnl is None:
+            return
+
+        st = self.styles[style]
+        st[0] += 1
+        st[5] += pnl
+        if pnl > 0:
+            st[1] += 1
+            st[3] += pnl
+        elif pnl < 0:
+            st[2] += 1
+            st[4] -= pnl
+
+        sym = self.symbols.setdefault(row.get("symbol") or "N/A", [0, 0])
+        sym[1] += 1
+        if pnl > 0:
+            sym[0] += 1
+
+        self._running += pnl
+        self.cum_pnls.append(self._running)
+
+    def add_bucket(self, style, user_id, side, symbol, vals):
+        # 일별 버킷 [count, win, lose, gross_profit, gross_loss, total] 을 한 번에 더함
+        count, win, _, _, _, total = vals
+        if side in self.sides:
+            self.sides[side] += count
+
+        user = self.users.setdefault(user_id, [0.0, 0])
+        user[0] += total
+        user[1] += count
+
+        st = self.styles[style]
+        for i, v in enumerate(vals):
+            st[i] += v
+
+        sym = self.symbols.setdefault(symbol, [0, 0])
+        sym[0] += win
+        sym[1] += count
+
+    def remove(self, style, row):
+        # add 의 역연산 (cum_pnls 는 호출 측에서 다시 계산)
+        pnl = row.get("pnl_pct")
+        side = row.get("side")
+        if side in self.sides:
+            self.sides[side] -= 1
+
+        user = self.users[row["user_id"]]
+        user[0] -= pnl if pnl is not None else 0
+        user[1] -= 1
+        if user[1] == 0:
+            del self.users[row["user_id"]]
+
+        if pnl is None:
+            return
+
+        st = self.styles[style]
+        st[0] -= 1
+        st[5] -= pnl
+        if pnl > 0:
+            st[1] -= 1
+            st[3] -= pnl
+        elif pnl < 0:
+            st[2] -= 1
+            st[4] += pnl
+        if st[0] == 0:
+            # 부동소수 누적 오차 제거
+            st[3] = st[4] = st[5] = 0.0
+
+        key = row.get("symbol") or "N/A"
+        sym = self.symbols[key]
+        sym[1] -= 1
+        if pnl > 0:
+            sym[0] -= 1
+        if sym[1] == 0:
+            del self.symbols[key]
+
+    def stats(self, style=None):
+        if style is None:
+            totals = [sum(v) for v in zip(*self.styles.values())]
+        else:
+            totals = self.styles[style]
+        return stats_from_totals(*totals)
+
+    def side_ratios(self):
+        long_cnt, short_cnt = self.sides["롱"], self.sides["숏"]
+        if long_cnt + short_cnt > 0:
+            return long_cnt / (long_cnt + short_cnt) * 100, short_cnt / (long_cnt + short_cnt) * 100
+        return 0, 0
+
+    def style_ratios(self):
+        scalp_cnt, swing_cnt = self.styles["scalping"][0], self.styles["swing"][0]
+        if scalp_cnt + swing_cnt > 0:
+            return scalp_cnt / (scalp_cnt + swing_cnt) * 100, swing_cnt / (scalp_cnt + swing_cnt) * 100
+        return 0, 0
+
+    def symbol_stats(self, top_n=3):
+        results = [(sym, win / total * 100, total) for sym, (win, total) in self.symbols.items()]
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results[:top_n], list(self.symbols.keys())
+
+    async def ranking(self, top_n=3):
+        aliases = await resolve_aliases(self.users.keys())
+        ranking = [(aliases[uid], total, total / cnt, cnt) for uid, (total, cnt) in self.users.items()]
+        ranking.sort(key=lambda x: x[1], reverse=True)  # 누적 손익률 순
+        return ranking[:top_n]
+
+async def aggregate_trades(period="week"):
+    agg = ReportAggregator()
+    async for style, row in iter_trades(period):
+        agg.add(style, row)
+    return agg
+
+# ====== 증분 스냅샷 ======
+class ReportSnapshot:
+    # 기간(week / month) 안의 매매를 메모리에 유지하며 집계를 증분 갱신
+    # 기록 시 add, 리포트 시 기간 밖으로 밀려난 매매만 remove
+    def __init__(self, period):
+        self.period = period
+        self.agg = ReportAggregator()
+        self.rows = {}      # (style, key) -> (ts, row)
+        self._expiry = []   # heap (ts, (style, key))
+        self.loading = False
+        self.loaded = False
+
+    @staticmethod
+    def _key(style, row):
+        if style == "swing":
+            return ("swing", row["trade_id"])
+        return ("scalping", (row["user_id"], row["created_at"]))
+
+    def add(self, style, row):
+        ts = parse_ts(row["date_closed"] if style == "swing" else row["created_at"])
+        start = period_start(self.period)
+        if start and ts < start:
+            return
+        key = self._key(style, row)
+        if key in self.rows:
+            # 로딩 중 들어온 같은 행 / 재기록은 교체
+            self.agg.remove(style, self.rows[key][1])
+        self.rows[key] = (ts, row)
+        self.agg.add(style, row)
+        heapq.heappush(self._expiry, (ts, key))
+
+    def evict(self):
+        start = period_start(self.period)
+        while self._expiry and self._expiry[0][0] < start:
+            ts, key = heapq.heappop(self._expiry)
+            entry = self.rows.get(key)
+            if entry and entry[0] == ts:
+                del self.rows[key]
+                self.agg.remove(key[0], entry[1])
+
+    async def load(self):
+        # 로딩 중 기록된 매매도 add 로 받음 (같은 행은 키로 중복 제거)
+        self.loading = True
+        async for style, row in iter_trades(self.period):
+            self.add(style, row)
+        self.loading = False
+        self.loaded = True
+        print(f"[Report] {self.period} 스냅샷 로드: {len(self.rows)}건")
+
+    def aggregator(self):
+        self.evict()
+        # 그래프 순서는 전체 재집계와 동일하게: 단타(created_at 순) → 장기(trade_id 순)
+        scalping = sorted((entry for (style, _), entry in self.rows.items() if style == "scalping"),
+                          key=lambda e: e[0])
+        swing = sorted((row for (style, _), (_, row) in self.rows.items() if style == "swing"),
+                       key=lambda r: r["trade_id"])
+        rows = [row for _, row in scalping] + swing
+        pnls = [row["pnl_pct"] for row in rows if row.get("pnl_pct") is not None]
+        self.agg.cum_pnls = array("d", accumulate(pnls))
+
+        # 종목 / 유저 순서도 첫 등장 순으로 맞춤 (동률 정렬 결과가 같도록)
+        users = dict.fromkeys(row["user_id"] for row in rows)
+        symbols = dict.fromkeys(row.get("symbol") or "N/A" for row in rows if row.get("pnl_pct") is not None)
+        self.agg.users = {uid: self.agg.users[uid] for uid in users}
+        self.agg.symbols = {sym: self.agg.symbols[sym] for sym in symbols}
+        return self.agg
+
+snapshots = {period: ReportSnapshot(period) for period in ("week", "month")}
+
+async def load_snapshots():
+    if REPORT_MODE == "snapshot":
+        await asyncio.gather(*(snap.load() for snap in snapshots.values()))
+
+def record_trade(style, row):
+    # 단타 기록(created_at) / 장기 청산(trade_id, date_closed) 시 DB 가 돌려준 행으로 호출
+    for snap in snapshots.values():
+        if snap.loaded or snap.loading:
+            snap.add(style, row)
+    daily_buckets.record_trade(style, row)
+
+async def build_aggregator(period="week", mode=None):
+    snap = snapshots.get(period)
+    if (mode or REPORT_MODE) == "snapshot" and snap and snap.loaded:
+        return snap.aggregator()
+    return await aggregate_trades(period)
+
+
+# ====== 임의 기간 (KST 일별 버킷 합산) ======
+def aggregate_range(start_day, end_day):
+    # start_day ~ end_day (date, 양끝 포함) — 거래 수가 아니라 날짜 수에 비례
+    agg = ReportAggregator()
+    running = 0.0
+    for _, buckets in daily_buckets.iter_days(start_day, end_day):
+        for (user_id, style, side, symbol), vals in buckets.items():
+            agg.add_bucket(style, user_id, side, symbol, vals)
+            running += vals[5]
+        agg.cum_pnls.append(running)   # 그래프는 일별 누적
+    return agg
+
+async def range_report(start_day, end_day, top_n=5):
+    # (메시지, 그래프 png 또는 None)
+    agg = aggregate_range(start_day, end_day)
+    ranking = await agg.ranking(top_n=top_n)
+    msg = format_message(f"{start_day} ~ {end_day}", agg, ranking)
+    chart = await render_chart("pnl", agg.cum_pnls) if len(agg.cum_pnls) > 1 else None
+    return msg, chart
+
+
+# ====== 검증: 스냅샷 vs 전체 재집계 ======
+def _close(a, b):
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+def compare_aggregators(a, b):
+    diffs = []
+    for style in ReportAggregator.STYLES:
+        x, y = a.styles[style], b.styles[style]
+        if x[:3] != y[:3] or not all(_close(p, q) for p, q in zip(x[3:], y[3:])):
+            diffs.append(f"styles[{style}]: {x} != {y}")
+    if a.sides != b.sides:
+        diffs.append(f"sides: {a.sides} != {b.sides}")
+    if a.symbols != b.symbols:
+        diffs.append(f"symbols: {a.symbols} != {b.symbols}")
+    if a.users.keys() != b.users.keys() or any(
+        a.users[u][1] != b.users[u][1] or not _close(a.users[u][0], b.users[u][0]) for u in a.users
+    ):
+        diffs.append("users 불일치")
+    if len(a.cum_pnls) != len(b.cum_pnls) or not all(_close(p, q) for p, q in zip(a.cum_pnls, b.cum_pnls)):
+        diffs.append(f"cum_pnls 불일치 ({len(a.cum_pnls)} vs {len(b.cum_pnls)})")
+    return diffs
+
+async def verify_snapshot(period="week"):
+    snap = snapshots[period]
+    if not snap.loaded:
+        await snap.load()
+    full = await aggregate_trades(period)
+    diffs = compare_aggregators(snap.aggregator(), full)
+    # 포맷된 숫자까지 같은지 확인
+    ranking_full = await full.ranking(top_n=5)
+    ranking_snap = await snap.agg.ranking(top_n=5)
+    if format_message(period, snap.agg, ranking_snap) != format_message(period, full, ranking_full):
+        diffs.append("메시지 불일치")
+
+    if diffs:
+        print(f"❌ [Report] {period} 스냅샷 불일치:", *diffs, sep="\n  ")
     else:
-        start = None
+        print(f"✅ [Report] {period} 스냅샷 = 전체 재집계 ({len(snap.rows)}건)")
+    return diffs
 
-    if start:
-        start_utc = start.astimezone(ZoneInfo("UTC"))
-    else:
-        start_utc = None
-
-    # scalping
-    query = supabase.table("scalping_trades").select("user_id,pnl_pct,side,symbol")
-    if start: query = query.gte("created_at", start.isoformat())
-    scalping = query.execute().data
-
-    # swing
-    query = supabase.table("swing_trades").select("user_id,pnl_pct,side,symbol")
-    if start: query = query.gte("date_closed", start.isoformat())
-    swing = query.execute().data
-
-    return scalping, swing
-
-# ====== 랭킹 계산 ======
-def calc_ranking(all_trades, top_n=3):
-    user_stats = {}
-    for row in all_trades:
-        uid = row["user_id"]
-        pnl = row["pnl_pct"] if row["pnl_pct"] is not None else 0
-        user_stats.setdefault(uid, []).append(pnl)
-
-    ranking = []
-    for uid, pnls in user_stats.items():
-        total = sum(pnls)
-        avg = total / len(pnls)
-        alias_resp = supabase.table("user_alias").select("alias").eq("user_id", uid).execute()
-        if alias_resp.data and len(alias_resp.data) > 0:
-            alias = alias_resp.data[0]["alias"]
-        else:
-            alias = f"유저{uid}"  # fallback
-        ranking.append((alias, total, avg, len(pnls)))
-
-    ranking.sort(key=lambda x: x[1], reverse=True)  # 누적 손익률 순
-    return ranking[:top_n]
-
-# ====== 종목별 승률 계산 ======
-def calc_symbol_stats(all_trades, top_n=3):
-    stats = defaultdict(lambda: {"win":0, "total":0})
-    for t in all_trades:
-        if t.get("pnl_pct") is None: 
-            continue
-        sym = t.get("symbol", "N/A")
-        stats[sym]["total"] += 1
-        if t["pnl_pct"] > 0:
-            stats[sym]["win"] += 1
-    
-    results = []
-    for sym, d in stats.items():
-        win_rate = d["win"] / d["total"] * 100
-        results.append((sym, win_rate, d["total"]))
-    
-    results.sort(key=lambda x: x[1], reverse=True)
-    return results[:top_n], list(stats.keys())
-    
-# ====== 그래프 생성 ======
-def generate_charts(all_trades):
-    pnls = [row["pnl_pct"] for row in all_trades if row["pnl_pct"] is not None]
-    cum_pnls = np.cumsum(pnls)
-
-    plt.figure(figsize=(6,4))
-    plt.plot(range(len(cum_pnls)), cum_pnls, marker="o")
-    plt.title("PNL 추이")
-    plt.xlabel("거래")
-    plt.ylabel("누적 PNL %")
-    plt.grid(True, linestyle="--", alpha=0.7)
-
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    plt.close()
-    return buf
 
 # ====== 메시지 포맷 ======
-def format_message(period, stats_scalp, stats_swing, stats_total, ranking, all_trades):
+def format_message(period, agg, ranking):
+    stats_scalp = agg.stats("scalping")
+    stats_swing = agg.stats("swing")
+    stats_total = agg.stats()
+
     period_display = {
         "week": "7DAY",
         "month": "30DAY"
@@ -156,36 +356,15 @@ def format_message(period, stats_scalp, stats_swing, stats_total, ranking, all_t
     msg += f"장기: {stats_swing['count']}건, 승률 {stats_swing['win_rate']:.1f}%, PNL {stats_swing['total']:.1f}%\n"
     msg += f"전체: {stats_total['count']}건, 승률 {stats_total['win_rate']:.1f}%, PNL {stats_total['total']:.1f}%\n\n"
     msg += f"수익지수(PF): {stats_total['pf']:.2f} {stats_total['pf_eval']}\n\n"
-    
-    long_cnt = len([t for t in all_trades if t.get("side") == "롱"])
-    short_cnt = len([t for t in all_trades if t.get("side") == "숏"])
-    total_pos = long_cnt + short_cnt
-    long_ratio = (long_cnt/total_pos*100) if total_pos else 0
-    short_ratio = (short_cnt/total_pos*100) if total_pos else 0
-    
-    scalp_cnt = stats_scalp["count"]
-    swing_cnt = stats_swing["count"]
-    total_style = scalp_cnt + swing_cnt
-    scalp_ratio = (scalp_cnt/total_style*100) if total_style else 0
-    swing_ratio = (swing_cnt/total_style*100) if total_style else 0
-    
-    if long_cnt + short_cnt > 0:
-        long_ratio = long_cnt / (long_cnt + short_cnt) * 100
-        short_ratio = short_cnt / (long_cnt + short_cnt) * 100
-    else:
-        long_ratio = short_ratio = 0
 
-    if scalp_cnt + swing_cnt > 0:
-        scalp_ratio = scalp_cnt / (scalp_cnt + swing_cnt) * 100
-        swing_ratio = swing_cnt / (scalp_cnt + swing_cnt) * 100
-    else:
-        scalp_ratio = swing_ratio = 0
+    long_ratio, short_ratio = agg.side_ratios()
+    scalp_ratio, swing_ratio = agg.style_ratios()
 
     msg += f"단타/장기 비율 → 단타 {scalp_ratio:.1f}%, 장기 {swing_ratio:.1f}%\n\n"
     
     msg += f"포지션 비율 → 롱 {long_ratio:.1f}%, 숏 {short_ratio:.1f}%\n"
 
-    top_symbols, all_symbols = calc_symbol_stats(all_trades, top_n=3)
+    top_symbols, all_symbols = agg.symbol_stats(top_n=3)
     if all_symbols:
         msg += f"이번주 거래 종목: {', '.join(all_symbols)}\n\n"
     if top_symbols:
@@ -202,31 +381,26 @@ def format_message(period, stats_scalp, stats_swing, stats_total, ranking, all_t
 
 # ====== 리포트 전송 ======
 async def send_report(bot, period="week"):
-    scalping, swing = fetch_trades(period)
-    all_trades = scalping + swing
-
-    stats_scalp = calc_stats([t["pnl_pct"] for t in scalping if t["pnl_pct"] is not None])
-    stats_swing = calc_stats([t["pnl_pct"] for t in swing if t["pnl_pct"] is not None])
-    stats_total = calc_stats([t["pnl_pct"] for t in all_trades if t["pnl_pct"] is not None])
-
-
-    ranking = calc_ranking(all_trades, top_n=3 if period=="week" else 5)
-
-    msg = format_message(period, stats_scalp, stats_swing, stats_total, ranking, all_trades)
-
-    # 그래프
-    chart = generate_charts(all_trades)
-
-    await bot.send_message(CHANNEL_ID, msg, parse_mode="HTML")
-    await bot.send_photo(CHANNEL_ID, InputFile(chart, filename="report.png"))
-
-
-
-
+    # 모든 섹션이 한 번의 순회로 채워진 집계 객체에서 렌더링 (기본: 증분 스냅샷, DB 조회 없음)
+    if REPORT_VERIFY:
+        await verify_snapshot(period)
+    agg = await build_aggregator(period)
 
+    ranking = await agg.ranking(top_n=3 if period=="week" else 5)
 
+    msg = format_message(period, agg, ranking)
 
+    # 그래프 (워커 프로세스에서 렌더링, 동일 데이터는 캐시 재사용)
+    chart = await render_chart("pnl", agg.cum_pnls)
 
+    await bot.send_message(CHANNEL_ID, msg, parse_mode="HTML", rate_limit_args=BROADCAST)
+    await bot.send_photo(CHANNEL_ID, InputFile(chart, filename="report.png"), rate_limit_args=BROADCAST)
 
 
+if __name__ == "__main__":
+    # python reporting.py → 두 기간의 스냅샷과 전체 재집계 결과 비교
+    async def main():
+        results = [await verify_snapshot(period) for period in snapshots]
+        raise SystemExit(1 if any(results) else 0)
 
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+# sector_digest.py
+import asyncio
+
+
+# ====== 캔들 시간별 섹터 변동률 모아 보내기 ======
+# - 같은 candle_time 의 4H 변동률을 창(window) 동안 모음
+# - 모든 섹터가 도착하거나 창이 닫히면 on_flush(candle_dt, changes) 한 번 호출
+class SectorDigest:
+    def __init__(self, expected_symbols, window, on_flush):
+        self.expected = set(expected_symbols)
+        self.window = window
+        self.on_flush = on_flush
+        self._windows = {}   # candle_dt -> {"changes": {symbol: change}, "timer": TimerHandle}
+        self._tasks = set()
+
+    def add(self, candle_dt, symbol, change):
+        win = self._windows.get(candle_dt)
+        if win is None:
+            loop = asyncio.get_running_loop()
+            win = self._windows[candle_dt] = {
+                "changes": {},
+                "timer": loop.call_later(self.window, self._close, candle_dt),
+            }
+        win["changes"][symbol] = change
+
+        if self.expected <= win["changes"].keys():
+            self._close(candle_dt)
+
+    def _close(self, candle_dt):
+        win = self._windows.pop(candle_dt, None)
+        if win is None:
+            return
+        win["timer"].cancel()
+        if win["changes"]:
+            task = asyncio.create_task(self._flush(candle_dt, win["changes"]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, candle_dt, changes):
+        missing = self.expected - changes.keys()
+        if missing:
+            print(f"[Digest] {candle_dt} 창 종료, 미도착 섹터: {sorted(missing)}")
+        try:
+            await self.on_flush(candle_dt, changes)
+        except Exception as e:
+            print(f"❌ [Digest] {candle_dt} 전송 실패:", e)
+
+    async def close_all(self):
+        # 종료 시 열린 창을 모두 전송
+        for candle_dt in list(self._windows):
+            self._close(candle_dt)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
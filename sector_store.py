@@ -0,0 +1,157 @@
+# sector_store.py
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from db import supabase, safe_supabase_call, iter_rows
+
+# (symbol, interval) 별로 유지할 캔들 수
+CANDLE_KEEP = {"1D": 1, "240": 3}
+SECTOR_FLUSH_INTERVAL = float(os.getenv("SECTOR_FLUSH_INTERVAL", "5"))   # 초, sector_candles 일괄 기록 주기
+# 기준가(1D)가 없을 때: "previous" = 최근 거래일 기준가 사용, "skip" = 계산하지 않음
+SECTOR_REF_FALLBACK = os.getenv("SECTOR_REF_FALLBACK", "previous")
+SECTOR_REF_MAX_AGE_DAYS = int(os.getenv("SECTOR_REF_MAX_AGE_DAYS", "1"))   # previous 로 거슬러 갈 최대 거래일 수
+SECTOR_REF_KEEP_DAYS = 7
+
+KST = ZoneInfo("Asia/Seoul")
+
+_buffers = {}       # (symbol, interval) -> deque[(dt_utc, close)] (시간 오름차순)
+_pending = {}       # (symbol, interval, candle_time) -> upsert 할 행
+_trim_keys = set()  # 오래된 행을 지워야 하는 (symbol, interval)
+_ref_index = {}     # (symbol, KST 거래일) -> 1D 기준가
+
+
+# ====== KST 거래일 (09:00 ~ 다음날 08:59) ======
+def trading_day(dt):
+    dt_kst = dt.astimezone(KST)
+    day = dt_kst.date()
+    if dt_kst.hour < 9:
+        day -= timedelta(days=1)
+    return day
+
+
+# ====== 링 버퍼 ======
+def _put(symbol, interval, dt_utc, close):
+    key = (symbol, interval)
+    buf = _buffers.get(key)
+    if buf is None:
+        buf = _buffers[key] = deque(maxlen=CANDLE_KEEP.get(interval, 3))
+
+    if buf and dt_utc < buf[0][0] and len(buf) == buf.maxlen:
+        return False   # 보관 범위보다 오래된 캔들
+    items = [c for c in buf if c[0] != dt_utc]
+    items.append((dt_utc, close))
+    items.sort(key=lambda c: c[0])
+    buf.clear()
+    buf.extend(items)   # maxlen 초과분은 앞(오래된 것)부터 버려짐
+
+    if interval == "1D":
+        _index_reference(symbol, dt_utc, close)
+    return True
+
+def add_candle(symbol, interval, dt_utc, close):
+    interval = str(interval)
+    if not _put(symbol, interval, dt_utc, close):
+        return
+    _pending[(symbol, interval, dt_utc.isoformat())] = {
+        "symbol": symbol,
+        "candle_time": dt_utc.isoformat(),
+        "candle_interval": interval,
+        "close": close
+    }
+    _trim_keys.add((symbol, interval))
+
+
+# ====== 기준가 인덱스 ======
+def _index_reference(symbol, dt_utc, close):
+    day = trading_day(dt_utc)
+    _ref_index[(symbol, day)] = close
+    cutoff = day - timedelta(days=SECTOR_REF_KEEP_DAYS)
+    for key in [k for k in _ref_index if k[0] == symbol and k[1] < cutoff]:
+        del _ref_index[key]
+
+def reference_close(symbol, day):
+    # (기준가, 사용한 거래일) 또는 None
+    close = _ref_index.get((symbol, day))
+    if close is not None:
+        return close, day
+
+    if SECTOR_REF_FALLBACK == "previous":
+        for back in range(1, SECTOR_REF_MAX_AGE_DAYS + 1):
+            prev = day - timedelta(days=back)
+            close = _ref_index.get((symbol, prev))
+            if close is not None:
+                return close, prev
+    return None
+
+def sector_change(symbol, close, dt):
+    # (변동률 %, 사용한 거래일) 또는 None
+    day = trading_day(dt)
+    ref = reference_close(symbol, day)
+    if ref is None:
+        print(f"[Ref] {symbol} {day} 기준가(1D) 없음 (fallback={SECTOR_REF_FALLBACK})")
+        return None
+    ref_close, ref_day = ref
+    if ref_day != day:
+        print(f"[Ref] {symbol} {day} 기준가 없음 → {ref_day} 기준가 사용")
+    return (close - ref_close) / ref_close * 100, ref_day
+
+def sector_changes(dt, symbols=None):
+    # 같은 거래일의 최신 4H 캔들이 있는 모든 섹터의 변동률 {symbol: (pct, ref_day)}
+    day = trading_day(dt)
+    results = {}
+    for (symbol, interval), buf in _buffers.items():
+        if interval != "240" or not buf or (symbols is not None and symbol not in symbols):
+            continue
+        candle_dt, close = buf[-1]
+        if trading_day(candle_dt) != day:
+            continue
+        change = sector_change(symbol, close, candle_dt)
+        if change is not None:
+            results[symbol] = change
+    return results
+
+
+# ====== 시작 시 테이블에서 복원 ======
+async def load_from_db():
+    count = 0
+    async for row in iter_rows(lambda: supabase.table("sector_candles")
+                               .select("symbol, candle_interval, candle_time, close")
+                               .order("candle_time").order("symbol").order("candle_interval")):
+        dt_utc = datetime.fromisoformat(row["candle_time"].replace("Z", "+00:00"))
+        _put(row["symbol"], str(row["candle_interval"]), dt_utc, float(row["close"]))
+        count += 1
+    print(f"[SectorStore] sector_candles {count}건 → 버퍼 {len(_buffers)}개 복원")
+
+
+# ====== sector_candles 일괄 기록 ======
+async def flush():
+    global _pending, _trim_keys
+    rows, _pending = list(_pending.values()), {}
+    trim_keys, _trim_keys = _trim_keys, set()
+
+    if rows:
+        response = await safe_supabase_call(
+            supabase.table("sector_candles").upsert(rows, on_conflict="symbol,candle_interval,candle_time")
+        )
+        if response is None:
+            # 실패한 행은 다음 주기에 재시도
+            for row in rows:
+                _pending.setdefault((row["symbol"], row["candle_interval"], row["candle_time"]), row)
+            _trim_keys |= trim_keys
+            return
+
+    # 버퍼에서 밀려난 오래된 행 삭제
+    for symbol, interval in trim_keys:
+        buf = _buffers.get((symbol, interval))
+        if not buf:
+            continue
+        await safe_supabase_call(
+            supabase.table("sector_candles").delete()
+            .eq("symbol", symbol)
+            .eq("candle_interval", interval)
+            .lt("candle_time", buf[0][0].isoformat())
+        )
+
+async def flush_job(ctx):
+    await flush()
@@ -0,0 +1,25 @@
+# singleflight.py
+import asyncio
+
+
+# ====== 키별 single-flight ======
+# 같은 키로 동시에 들어온 요청은 진행 중인 하나의 작업과 그 결과를 공유
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+
+    def start(self, key, fn, *args):
+        fut = self._calls.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn(*args))
+            self._calls[key] = fut
+
+            def _done(f, key=key):
+                if self._calls.get(key) is f:
+                    del self._calls[key]
+            fut.add_done_callback(_done)
+        return fut
+
+    async def do(self, key, fn, *args):
+        # 대기자 한 명이 취소돼도 공유 작업은 계속 진행
+        return await asyncio.shield(self.start(key, fn, *args))
@@ -0,0 +1,129 @@
+# update_scheduler.py
+import asyncio
+import time
+from collections import deque
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+# ====== 채팅별 순서 보장 + 전역 동시 처리 제한 ======
+# - 서로 다른 채팅/유저의 업데이트는 동시에 처리
+# - 같은 채팅의 업데이트는 도착 순서대로 하나씩 처리 (ConversationHandler 흐름 보호)
+# - 전역 동시 처리 수는 max_concurrent_updates 로 제한
+# - 채팅별 큐 + 처리 태스크: 큐에 넣는 쪽(웹훅)은 바로 반환
+# - 전체 대기 업데이트 수가 max_queued 를 넘으면 asyncio.QueueFull (웹훅은 503 응답)
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates, max_queued=1000, sample_size=200):
+        super().__init__(max_concurrent_updates)
+        self.max_queued = max_queued
+        self._queues = {}    # key -> deque[(update, coroutine, future, enqueued_at)] (맨 앞 = 처리 중)
+        self._tasks = set()  # 채팅별 처리 태스크
+        self._pending = 0    # 처리가 끝나지 않은 업데이트 수
+        self._waits = deque(maxlen=sample_size)
+        self._durations = deque(maxlen=sample_size)
+        self.processed = 0
+        self.rejected = 0
+
+    @staticmethod
+    def ordering_key(update):
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return ("chat", update.effective_chat.id)
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+        return None
+
+    def enqueue(self, update, coroutine):
+        # 채팅별 큐에 넣고 바로 반환 (처리 완료 시 결과가 채워지는 future)
+        # → 호출한 쪽은 같은 채팅의 앞선 업데이트를 기다리지 않음
+        if self._pending >= self.max_queued:
+            coroutine.close()
+            self.rejected += 1
+            raise asyncio.QueueFull
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(self._report_error)
+        item = (update, coroutine, future, time.monotonic())
+        self._pending += 1
+
+        key = self.ordering_key(update)
+        queue = self._queues.get(key) if key is not None else None
+        if queue is not None:
+            queue.append(item)
+            return future
+
+        queue = deque([item])
+        if key is not None:
+            self._queues[key] = queue
+        task = asyncio.create_task(self._drain(key, queue))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return future
+
+    async def submit(self, update, coroutine):
+        # 처리가 끝날 때까지 기다림 (웹훅 직접 처리 모드)
+        await self.enqueue(update, coroutine)
+
+    async def _drain(self, key, queue):
+        # 같은 채팅은 도착 순서대로 하나씩, 전역 동시 처리 수는 세마포어(process_update)로 제한
+        while queue:
+            update, coroutine, future, enqueued_at = queue[0]
+            try:
+                await self.process_update(update, self._timed(coroutine, enqueued_at))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(None)
+            finally:
+                self._pending -= 1
+                self.processed += 1
+            queue.popleft()
+        if key is not None and self._queues.get(key) is queue:
+            del self._queues[key]
+
+    async def _timed(self, coroutine, enqueued_at):
+        # 세마포어를 얻어 실제 처리가 시작된 시점 기준 대기 시간 / 처리 시간
+        started = time.monotonic()
+        self._waits.append(started - enqueued_at)
+        try:
+            await coroutine
+        finally:
+            self._durations.append(time.monotonic() - started)
+
+    @staticmethod
+    def _report_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            print("❌ Update processing error:", future.exception())
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def join(self):
+        # 큐에 남은 업데이트까지 모두 처리될 때까지 대기
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def shutdown(self):
+        await self.join()
+
+    def stats(self):
+        def summary(samples):
+            if not samples:
+                return {"avg": 0, "max": 0}
+            return {"avg": round(sum(samples) / len(samples), 4), "max": round(max(samples), 4)}
+
+        return {
+            "max_concurrent_updates": self.max_concurrent_updates,
+            "current_concurrent_updates": self.current_concurrent_updates,
+            "active_chats": len(self._queues),
+            "queued_updates": self._pending,
+            "max_queued": self.max_queued,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "wait_sec": summary(self._waits),
+            "duration_sec": summary(self._durations),
+        }
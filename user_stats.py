@@ -0,0 +1,224 @@
+# user_stats.py
+import os
+import asyncio
+from collections import OrderedDict
+from db import supabase, supabase_call, safe_supabase_call, iter_rows
+from analytics import stats_from_totals
+
+# user_stats 테이블: (user_id, style) 당 한 행
+#   style: "scalping" | "swing"
+#   count, win, lose, gross_profit, gross_loss, total, open_count, closed_count
+STYLES = ("scalping", "swing")
+FIELDS = ("count", "win", "lose", "gross_profit", "gross_loss", "total", "open_count", "closed_count")
+
+USER_STATS_CACHE_SIZE = int(os.getenv("USER_STATS_CACHE_SIZE", "10000"))                  # 보관할 사용자 수
+USER_STATS_RECONCILE_INTERVAL = float(os.getenv("USER_STATS_RECONCILE_INTERVAL", "60"))   # 초
+
+_cache = OrderedDict()   # user_id -> records (LRU)
+_locks = {}
+_dirty = set()           # 저장 실패로 테이블 값을 믿을 수 없는 사용자 → 원본 테이블로 재계산
+
+
+def empty_record():
+    return {f: 0 for f in FIELDS}
+
+def _lock(user_id):
+    return _locks.setdefault(user_id, asyncio.Lock())
+
+def _cache_get(user_id):
+    records = _cache.get(user_id)
+    if records is not None:
+        _cache.move_to_end(user_id)
+    return records
+
+def _cache_put(user_id, records):
+    _cache[user_id] = records
+    _cache.move_to_end(user_id)
+    while len(_cache) > USER_STATS_CACHE_SIZE:
+        evicted, _ = _cache.popitem(last=False)
+        lock = _locks.get(evicted)
+        if lock is not None and not lock.locked():
+            del _locks[evicted]
+
+def apply_pnl(rec, pnl):
+    rec["count"] += 1
+    rec["total"] += pnl
+    if pnl > 0:
+        rec["win"] += 1
+        rec["gross_profit"] += pnl
+    elif pnl < 0:
+        rec["lose"] += 1
+        rec["gross_loss"] += -pnl
+
+def merge_records(*recs):
+    merged = empty_record()
+    for rec in recs:
+        for f in FIELDS:
+            merged[f] += rec[f]
+    return merged
+
+
+# ====== 통계 계산 (집계값 → 통계) ======
+def stats_from_record(rec):
+    return stats_from_totals(rec["count"], rec["win"], rec["lose"],
+                             rec["gross_profit"], rec["gross_loss"], rec["total"])
+
+
+# ====== 저장 ======
+async def _save(user_id, records):
+    # 실패 시 dirty 로 표시 → reconcile 에서 원본 테이블로 재계산
+    rows = [{"user_id": user_id, "style": style, **records[style]} for style in STYLES]
+    response = await safe_supabase_call(
+        supabase.table("user_stats").upsert(rows, on_conflict="user_id,style")
+    )
+    if response is None:
+        _dirty.add(user_id)
+        return False
+    _dirty.discard(user_id)
+    return True
+
+
+# ====== 백필 (전체 재계산) ======
+async def _scan(scalping_query, swing_query):
+    # 원본 테이블을 페이지 단위로 읽으며 user_id -> records 에 바로 누적
+    all_records = {}
+
+    def records_for(uid):
+        return all_records.setdefault(uid, {style: empty_record() for style in STYLES})
+
+    async for row in iter_rows(scalping_query):
+        rec = records_for(row["user_id"])["scalping"]
+        if row["pnl_pct"] is not None:
+            apply_pnl(rec, float(row["pnl_pct"]))
+    async for row in iter_rows(swing_query):
+        rec = records_for(row["user_id"])["swing"]
+        if row["exit_price"] is None:
+            rec["open_count"] += 1
+        else:
+            rec["closed_count"] += 1
+        if row["pnl_pct"] is not None:
+            apply_pnl(rec, float(row["pnl_pct"]))
+    return all_records
+
+
+async def rebuild_user(user_id):
+    # PostgREST 행 제한에 잘리지 않도록 정렬된 페이지 단위로 전부 읽음
+    all_records = await _scan(
+        lambda: supabase.table("scalping_trades").select("user_id, pnl_pct")
+        .eq("user_id", user_id).order("created_at").order("id"),
+        lambda: supabase.table("swing_trades").select("user_id, pnl_pct, exit_price")
+        .eq("user_id", user_id).order("trade_id"),
+    )
+    records = all_records.get(user_id) or {style: empty_record() for style in STYLES}
+    _cache_put(user_id, records)
+    await _save(user_id, records)
+    return records
+
+
+async def rebuild_all():
+    all_records = await _scan(
+        lambda: supabase.table("scalping_trades").select("user_id, pnl_pct").order("created_at").order("id"),
+        lambda: supabase.table("swing_trades").select("user_id, pnl_pct, exit_price").order("trade_id"),
+    )
+
+    for uid, records in all_records.items():
+        _cache_put(uid, records)
+        await _save(uid, records)
+    print(f"[UserStats] 전체 재계산 완료: {len(all_records)}명")
+    return len(all_records)
+
+
+# ====== 검증 / 재계산 ======
+async def _matches_source(user_id, records):
+    # 저장된 거래 수가 원본 테이블과 같은지 (비정상 종료로 빠진 증분 감지), 조회 실패 시 그대로 신뢰
+    try:
+        scalping, swing = await asyncio.gather(
+            supabase_call(supabase.table("scalping_trades").select("user_id", count="exact", head=True)
+                          .eq("user_id", user_id).not_.is_("pnl_pct", None)),
+            supabase_call(supabase.table("swing_trades").select("user_id", count="exact", head=True)
+                          .eq("user_id", user_id)),
+        )
+    except Exception as e:
+        print("❌ Supabase error:", e)
+        return True
+    swing_rec = records["swing"]
+    return (scalping.count == records["scalping"]["count"]
+            and swing.count == swing_rec["open_count"] + swing_rec["closed_count"])
+
+async def reconcile():
+    for user_id in list(_dirty):
+        async with _lock(user_id):
+            if user_id in _dirty:
+                print(f"[UserStats] {user_id} 저장 실패분 재계산")
+                await rebuild_user(user_id)
+
+async def reconcile_job(ctx):
+    await reconcile()
+
+
+# ====== 조회 ======
+async def _load(user_id):
+    # (records, rebuilt) 반환 — rebuilt 이면 방금 기록된 거래까지 이미 반영됨
+    records = _cache_get(user_id)
+    if records is not None:
+        return records, False
+
+    response = await safe_supabase_call(
+        supabase.table("user_stats").select("*").eq("user_id", user_id)
+    )
+    if response and response.data:
+        records = {style: empty_record() for style in STYLES}
+        for row in response.data:
+            if row.get("style") in records:
+                records[row["style"]] = {f: row.get(f) or 0 for f in FIELDS}
+        if await _matches_source(user_id, records):
+            _cache_put(user_id, records)
+            return records, False
+        print(f"[UserStats] {user_id} 집계가 원본과 다름 → 재계산")
+        return await rebuild_user(user_id), True
+
+    # 집계 레코드가 없으면 한 번만 원본 테이블에서 백필
+    return await rebuild_user(user_id), True
+
+
+async def get_user_stats(user_id):
+    async with _lock(user_id):
+        records, _ = await _load(user_id)
+        return records
+
+
+# ====== 증분 업데이트 (원본 테이블에 기록한 뒤 호출) ======
+async def _update(user_id, apply):
+    async with _lock(user_id):
+        try:
+            records, rebuilt = await _load(user_id)
+            if rebuilt:
+                return
+            apply(records)
+        except Exception as e:
+            print(f"❌ [UserStats] {user_id} 갱신 실패:", e)
+            _cache.pop(user_id, None)
+            _dirty.add(user_id)
+            return
+        await _save(user_id, records)
+
+async def record_scalping(user_id, pnl_pct):
+    await _update(user_id, lambda records: apply_pnl(records["scalping"], float(pnl_pct)))
+
+async def record_swing_open(user_id):
+    def apply(records):
+        records["swing"]["open_count"] += 1
+    await _update(user_id, apply)
+
+async def record_swing_close(user_id, pnl_pct):
+    def apply(records):
+        rec = records["swing"]
+        rec["open_count"] = max(rec["open_count"] - 1, 0)
+        rec["closed_count"] += 1
+        apply_pnl(rec, float(pnl_pct))
+    await _update(user_id, apply)
+
+
+if __name__ == "__main__":
+    # 백필: python user_stats.py
+    asyncio.run(rebuild_all())
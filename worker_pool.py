@@ -0,0 +1,85 @@
+# worker_pool.py
+import asyncio
+import time
+from collections import deque
+
+
+# ====== 제한된 큐 + 워커 풀 ======
+class WorkerPool:
+    def __init__(self, name, handler, workers=4, maxsize=1000, sample_size=200):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks = []
+        self._keys = set()   # 대기 중이거나 실행 중인 작업 키 (중복 제출 방지)
+        self._waits = deque(maxlen=sample_size)
+        self._durations = deque(maxlen=sample_size)
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.deduped = 0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+            print(f"[{self.name}] 워커 {self.workers}개 시작 (maxsize={self.queue.maxsize})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def is_active(self, key):
+        return key in self._keys
+
+    def submit(self, item, key=None):
+        # 큐가 가득 차면 asyncio.QueueFull, 같은 key 작업이 이미 있으면 None, 성공 시 대기 순번 반환
+        if key is not None and key in self._keys:
+            self.deduped += 1
+            return None
+        try:
+            self.queue.put_nowait((time.monotonic(), key, item))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        if key is not None:
+            self._keys.add(key)
+        return self.queue.qsize()
+
+    async def _worker(self, idx):
+        while True:
+            enqueued_at, key, item = await self.queue.get()
+            started = time.monotonic()
+            self._waits.append(started - enqueued_at)
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ [{self.name}] worker {idx} error:", e)
+            finally:
+                self._durations.append(time.monotonic() - started)
+                self._keys.discard(key)
+                self.queue.task_done()
+
+    def stats(self):
+        def summary(samples):
+            if not samples:
+                return {"avg": 0, "max": 0}
+            return {"avg": round(sum(samples) / len(samples), 4), "max": round(max(samples), 4)}
+
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "depth": self.queue.qsize(),
+            "active": len(self._keys),
+            "maxsize": self.queue.maxsize,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "deduped": self.deduped,
+            "wait_sec": summary(self._waits),
+            "duration_sec": summary(self._durations),
+        }